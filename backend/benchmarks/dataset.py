@@ -0,0 +1,60 @@
+"""
+Synthetic question bank
+
+Seeds a database with a reproducible set of categories and questions for
+the benchmarks. Question texts are drawn from a small vocabulary so search
+terms hit a realistic share of rows.
+"""
+import random
+
+from flaskr import bulk
+from models import db, notify, Category, Question
+
+WORDS = (
+    "what", "which", "who", "where", "when", "first", "largest", "world", "river", "city",
+    "painter", "team", "cup", "novel", "planet", "element", "king", "queen", "battle", "song",
+    "movie", "actor", "island", "mountain", "country", "invented", "discovered", "wrote", "won", "named",
+)
+BATCH_SIZE = 10000
+
+
+def question_text(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 12))).capitalize() + "?"
+
+
+def seed(questions=10000, categories=6, seed=0, reseed=False):
+    """
+    Fill the app's database with `questions` rows over `categories`
+    categories. Does nothing if questions already exist, unless `reseed`
+    is set, in which case every existing question and category is deleted
+    first. Must run inside an app context.
+    """
+    if reseed:
+        Question.query.delete()
+        Category.query.delete()
+        db.session.commit()
+    elif db.session.query(Question.id).first() is not None:
+        return False
+
+    rng = random.Random(seed)
+    db.session.execute(Category.__table__.insert(),
+                       [{"type": "Category {}".format(i + 1)} for i in range(categories)])
+    db.session.commit()
+    category_ids = [category_id for category_id, in db.session.query(Category.id)]
+
+    batch = []
+    for i in range(questions):
+        batch.append({
+            "question": question_text(rng),
+            "answer": rng.choice(WORDS).capitalize(),
+            "difficulty": rng.randint(1, 5),
+            "category": rng.choice(category_ids),
+        })
+        if len(batch) >= BATCH_SIZE:
+            bulk.write_batch(batch)
+            batch = []
+    if batch:
+        bulk.write_batch(batch)
+    notify(Category.__tablename__, 'reload', None)
+    notify(Question.__tablename__, 'reload', None)
+    return True
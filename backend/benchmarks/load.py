@@ -0,0 +1,152 @@
+"""
+HTTP load test
+
+Drives a running server, or one it starts itself, with a fixed number of
+concurrent keep-alive clients for a given duration and prints requests per
+second and latency percentiles per route. Compare serving modes at equal
+core counts by giving both the same --workers:
+
+    DATABASE_URL=sqlite:////tmp/trivia.db python -m benchmarks.load --serve wsgi --workers 2
+    DATABASE_URL=sqlite:////tmp/trivia.db python -m benchmarks.load --serve asgi --workers 2
+    python -m benchmarks.load --url http://127.0.0.1:5000
+
+The database named by DATABASE_URL must already hold questions, e.g. one
+seeded with `flask import-questions`.
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+# (name, method, path, JSON body) requested round-robin by every client
+SCENARIO = (
+    ("GET /categories", "GET", "/categories", None),
+    ("GET /questions", "GET", "/questions?page=2", None),
+    ("GET /categories/1/questions", "GET", "/categories/1/questions", None),
+    ("POST /questions search", "POST", "/questions", {"searchTerm": "what"}),
+    ("POST /quizzes", "POST", "/quizzes", {"previous_questions": [], "quiz_category": {"id": 0, "type": "click"}}),
+)
+
+SERVERS = {
+    "wsgi": ["gunicorn", "--workers", "{workers}", "--threads", "{threads}",
+             "--bind", "127.0.0.1:{port}", "flaskr:create_app()"],
+    "asgi": ["uvicorn", "--factory", "flaskr.asgi:create_asgi_app", "--workers", "{workers}",
+             "--host", "127.0.0.1", "--port", "{port}", "--log-level", "warning"],
+}
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def start_server(mode, workers, threads, port):
+    command = [part.format(workers=workers, threads=threads, port=port) for part in SERVERS[mode]]
+    env = dict(os.environ, ASGI_THREADS=str(threads))
+    server = subprocess.Popen(command, env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return server
+        except OSError:
+            if server.poll() is not None:
+                raise SystemExit("{} exited with status {}".format(command[0], server.returncode))
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit("{} did not start listening on port {}".format(command[0], port))
+
+
+def client(host, port, deadline, offset, results, lock):
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    latencies = {name: [] for name, _, _, _ in SCENARIO}
+    errors = 0
+    i = offset
+    while time.monotonic() < deadline:
+        name, method, path, body = SCENARIO[i % len(SCENARIO)]
+        i += 1
+        payload = json.dumps(body) if body is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        start = time.perf_counter()
+        try:
+            connection.request(method, path, body=payload, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 500:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+            connection = http.client.HTTPConnection(host, port, timeout=30)
+            continue
+        latencies[name].append(time.perf_counter() - start)
+    connection.close()
+    with lock:
+        for name, values in latencies.items():
+            results["latencies"][name].extend(values)
+        results["errors"] += errors
+
+
+def run(url, concurrency, duration):
+    parts = urlsplit(url)
+    results = {"latencies": {name: [] for name, _, _, _ in SCENARIO}, "errors": 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    threads = [threading.Thread(target=client, args=(parts.hostname, parts.port or 80, deadline, i, results, lock))
+               for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def report(results, duration):
+    print("{:<30} {:>8} {:>9} {:>9} {:>9} {:>9}".format("route", "requests", "req/s", "p50 ms", "p90 ms", "p99 ms"))
+    everything = []
+    for name, values in results["latencies"].items():
+        everything.extend(values)
+        print("{:<30} {:>8} {:>9.1f} {:>9.2f} {:>9.2f} {:>9.2f}".format(
+            name, len(values), len(values) / duration, percentile(values, 0.5) * 1e3,
+            percentile(values, 0.9) * 1e3, percentile(values, 0.99) * 1e3))
+    print("{:<30} {:>8} {:>9.1f} {:>9.2f} {:>9.2f} {:>9.2f}".format(
+        "total", len(everything), len(everything) / duration, percentile(everything, 0.5) * 1e3,
+        percentile(everything, 0.9) * 1e3, percentile(everything, 0.99) * 1e3))
+    print("errors: {}".format(results["errors"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", help="base URL of a running server")
+    parser.add_argument("--serve", choices=sorted(SERVERS), help="start a server in this mode")
+    parser.add_argument("--workers", type=int, default=1, help="server processes (cores to use)")
+    parser.add_argument("--threads", type=int, default=10, help="handler threads per process")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args(argv)
+    if not args.url and not args.serve:
+        parser.error("give --url or --serve")
+
+    server = start_server(args.serve, args.workers, args.threads, args.port) if args.serve else None
+    try:
+        url = args.url or "http://127.0.0.1:{}".format(args.port)
+        print("{} {} worker(s), {} clients, {:.0f}s".format(
+            args.serve or url, args.workers, args.concurrency, args.duration))
+        report(run(url, args.concurrency, args.duration), args.duration)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
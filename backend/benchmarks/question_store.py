@@ -0,0 +1,86 @@
+"""
+Question store benchmark
+
+Loads the same questions into an in-memory SQLite database and into a
+QuestionStore, then prints the memory the store takes and the latency of
+one page of GET /questions (first page, a deep ?page= and a category page)
+on three paths: full ORM instances with Question.format(), the projected
+SQL query the handlers use, and the store.
+
+    python -m benchmarks.question_store [rows]
+"""
+import gc
+import sys
+import timeit
+import tracemalloc
+
+from flaskr import create_app, bulk, paging, serialization, QUESTIONS_PER_PAGE
+from flaskr.store import QuestionStore
+from models import Category, Question
+
+DEFAULT_ROWS = 100000
+CATEGORIES = 6
+CALLS = 200
+
+
+def seed(rows):
+    for i in range(CATEGORIES):
+        Category(type="Category {}".format(i + 1)).insert()
+    bulk.write_batch([{"question": "Question {}?".format(i), "answer": "Answer {}".format(i),
+                       "difficulty": 1 + i % 5, "category": 1 + i % CATEGORIES} for i in range(rows)])
+
+
+def orm_path(args, category_id):
+    query = Question.query
+    if category_id is not None:
+        query = query.filter(Question.category == category_id)
+    page = int(args.get("page", 1))
+    questions = query.order_by(Question.id).offset((page - 1) * QUESTIONS_PER_PAGE).limit(QUESTIONS_PER_PAGE)
+    return [question.format() for question in questions]
+
+
+def sql_path(args, category_id):
+    query = serialization.question_query()
+    if category_id is not None:
+        query = query.filter(Question.category == category_id)
+    rows, _ = paging.page_from_request(args, query, Question.id, QUESTIONS_PER_PAGE)
+    return serialization.format_rows(rows)
+
+
+def store_path(store):
+    def page(args, category_id):
+        rows, _ = store.page_from_request(args, per_page=QUESTIONS_PER_PAGE, category_id=category_id)
+        return serialization.format_rows(rows)
+    return page
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS
+    app = create_app({"SQLALCHEMY_DATABASE_URI": "sqlite://"})
+    with app.app_context():
+        seed(rows)
+        store = QuestionStore(ttl=float("inf"))
+        # traced from the query on, so the strings the store keeps count;
+        # only what is still allocated once the rows are dropped is kept
+        tracemalloc.start()
+        loaded = serialization.question_query().order_by(Question.id).all()
+        store.load(loaded)
+        del loaded
+        gc.collect()
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print("{} questions, store takes {:.1f} MB ({:.0f} bytes per question)".format(
+            rows, memory / 2 ** 20, memory / rows))
+        pages = (("first page", {}, None),
+                 ("?page= near the end", {"page": str(rows // QUESTIONS_PER_PAGE)}, None),
+                 ("category page", {}, 1))
+        print("{:>22} {:>12} {:>12} {:>12}".format("", "ORM (us)", "SQL (us)", "store (us)"))
+        for name, args, category_id in pages:
+            timings = [timeit.timeit(lambda: path(args, category_id), number=CALLS) / CALLS * 1e6
+                       for path in (orm_path, sql_path, store_path(store))]
+            print("{:>22} {:>12.1f} {:>12.1f} {:>12.1f}".format(name, *timings))
+
+
+if __name__ == "__main__":
+    main()
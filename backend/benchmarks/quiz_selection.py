@@ -0,0 +1,50 @@
+"""
+Quiz selection benchmark
+
+Times one /quizzes draw with the in-memory QuestionIndex against the old
+strategy of materializing every unseen candidate, for growing table sizes.
+The index latency should stay flat while the old strategy grows linearly.
+
+    python -m benchmarks.quiz_selection
+"""
+import random
+import timeit
+
+from flaskr.quiz import QuestionIndex
+
+SIZES = (1000, 10000, 100000, 1000000)
+CATEGORIES = 6
+PREVIOUS_QUESTIONS = 5
+DRAWS = 1000
+
+
+def build(size):
+    rng = random.Random(size)
+    pairs = [(question_id, rng.randint(1, CATEGORIES)) for question_id in range(1, size + 1)]
+    index = QuestionIndex(ttl=float("inf"), rng=rng)
+    index.load((question_id, category, rng.randint(1, 5)) for question_id, category in pairs)
+    previous_questions = [rng.randint(1, size) for _ in range(PREVIOUS_QUESTIONS)]
+    return pairs, index, previous_questions
+
+
+def materialize_all(pairs, category_id, previous_questions, rng):
+    candidates = [question_id for question_id, category in pairs
+                  if category == category_id and question_id not in previous_questions]
+    return candidates[rng.randrange(len(candidates))]
+
+
+def main():
+    print("{:>10} {:>16} {:>16}".format("questions", "index (us)", "materialize (us)"))
+    for size in SIZES:
+        pairs, index, previous_questions = build(size)
+        seen = set(previous_questions)
+        indexed = timeit.timeit(lambda: index.draw(1, seen), number=DRAWS) / DRAWS
+        rng = random.Random(0)
+        naive_draws = max(1, DRAWS * 1000 // size)
+        naive = timeit.timeit(
+            lambda: materialize_all(pairs, 1, previous_questions, rng), number=naive_draws) / naive_draws
+        print("{:>10} {:>16.2f} {:>16.2f}".format(size, indexed * 1e6, naive * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Serialization benchmark
+
+Serializes the same questions with the ORM path (full Question instances,
+Question.format(), standard JSON encoder) and the lean path (projected
+tuples, serialization.format_rows(), FastJSONEncoder) on an in-memory
+SQLite database, and prints rows per second for each.
+
+    python -m benchmarks.serialization [rows]
+"""
+import json
+import sys
+import time
+
+from flask.json import JSONEncoder
+
+from flaskr import create_app, bulk, serialization
+from models import Category, Question
+
+DEFAULT_ROWS = 100000
+REPEAT = 3
+
+
+def seed(rows):
+    Category(type="Science").insert()
+    batch = [{"question": "Question {}?".format(i), "answer": "Answer {}".format(i),
+              "difficulty": 1 + i % 5, "category": 1} for i in range(rows)]
+    bulk.write_batch(batch)
+
+
+def orm_path():
+    questions = [question.format() for question in Question.query.order_by(Question.id).all()]
+    return json.dumps(questions, cls=JSONEncoder)
+
+
+def lean_path():
+    rows = serialization.question_query().order_by(Question.id).all()
+    return json.dumps(serialization.format_rows(rows), cls=serialization.FastJSONEncoder)
+
+
+def rate(path, rows):
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        path()
+        best = min(best, time.perf_counter() - start)
+    return rows / best
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS
+    app = create_app({"SQLALCHEMY_DATABASE_URI": "sqlite://"})
+    with app.app_context():
+        seed(rows)
+        before = rate(orm_path, rows)
+        after = rate(lean_path, rows)
+    print("orjson installed: {}".format(serialization.orjson is not None))
+    print("{:>28} {:>14.0f} rows/s".format("ORM + format() + json", before))
+    print("{:>28} {:>14.0f} rows/s".format("projection + fast encoder", after))
+    print("{:>28} {:>14.1f}x".format("speedup", after / before))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""
+Endpoint benchmark suite
+
+Seeds a synthetic question bank, then drives every route through the Flask
+test client and through a real HTTP server, and reports per route:
+requests per second, p50/p95/p99 latency and SQL queries per request.
+
+    python -m benchmarks.suite --questions 100000 --categories 20
+    python -m benchmarks.suite --database postgresql://user:pw@localhost/trivia_bench
+    python -m benchmarks.suite --json results.json
+    python -m benchmarks.suite --compare results.json
+
+--compare exits with status 1 when a route got slower than the baseline by
+more than --tolerance, or issues more queries per request, so handler
+regressions show up as numbers rather than impressions.
+"""
+import argparse
+import http.client
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import event
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from flaskr import create_app
+from models import db
+from . import dataset
+
+DEFAULT_ITERATIONS = 200
+
+
+class QueryCounter:
+    """Counts statements sent to the database by the app's engine."""
+
+    def __init__(self, engine):
+        self.count = 0
+        self._lock = threading.Lock()
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        with self._lock:
+            self.count += 1
+
+
+class Scenario:
+    """
+    One route under test. `request(state)` returns (method, path, JSON body)
+    for the next call and `after(state, response_json)` may record what the
+    following calls need, such as ids created by a write.
+    """
+
+    def __init__(self, name, request, after=None):
+        self.name = name
+        self.request = request
+        self.after = after or (lambda state, data: None)
+
+
+def _remember(key, field):
+    def after(state, data):
+        if data and data.get(field) is not None:
+            value = data[field]
+            state.setdefault(key, []).extend(value if isinstance(value, list) else [value])
+    return after
+
+
+def _pop(state, key, default):
+    values = state.get(key)
+    return values.pop() if values else default
+
+
+def _new_question(state):
+    return {"question": "Benchmark question?", "answer": "Yes", "difficulty": 3,
+            "category": state["category_id"]}
+
+
+SCENARIOS = (
+    Scenario("GET /categories", lambda s: ("GET", "/categories", None)),
+    Scenario("GET /questions", lambda s: ("GET", "/questions", None)),
+    Scenario("GET /questions?page=N", lambda s: ("GET", "/questions?page={}".format(s["last_page"]), None)),
+    Scenario("GET /questions?cursor", lambda s: ("GET", "/questions?after_id={}".format(s["middle_id"]), None)),
+    Scenario("GET /categories/<id>/questions",
+             lambda s: ("GET", "/categories/{}/questions".format(s["category_id"]), None)),
+    Scenario("POST /questions (search)",
+             lambda s: ("POST", "/questions", {"searchTerm": "world riv"})),
+    Scenario("POST /quizzes",
+             lambda s: ("POST", "/quizzes", {"previous_questions": [s["middle_id"]],
+                                             "quiz_category": {"id": s["category_id"], "type": ""}})),
+    Scenario("POST /quizzes/sessions",
+             lambda s: ("POST", "/quizzes/sessions", {"quiz_category": {"id": s["category_id"], "type": ""}}),
+             after=lambda s, data: s.__setitem__("session_id", data["session"]["id"])),
+    Scenario("POST /quizzes/sessions/<id>/next",
+             lambda s: ("POST", "/quizzes/sessions/{}/next".format(s["session_id"]), None)),
+    Scenario("POST /questions (create)", lambda s: ("POST", "/questions", _new_question(s)),
+             after=_remember("created", "created")),
+    Scenario("DELETE /questions/<id>",
+             lambda s: ("DELETE", "/questions/{}".format(_pop(s, "created", -1)), None)),
+    Scenario("POST /questions/batch",
+             lambda s: ("POST", "/questions/batch", {"questions": [_new_question(s)] * 10}),
+             after=_remember("batch", "created")),
+    Scenario("DELETE /questions?ids=",
+             lambda s: ("DELETE", "/questions?ids={}".format(
+                 ",".join(str(_pop(s, "batch", -1)) for _ in range(10))), None)),
+)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def summarize(latencies, queries, elapsed):
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1e3,
+        "p95_ms": percentile(latencies, 0.95) * 1e3,
+        "p99_ms": percentile(latencies, 0.99) * 1e3,
+        "queries": sum(queries) / len(queries) if queries else 0.0,
+    }
+
+
+class QuietHandler(WSGIRequestHandler):
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def client_driver(app):
+    client = app.test_client()
+
+    def call(method, path, body):
+        response = client.open(path, method=method, json=body)
+        return response.status_code, response.get_json(silent=True)
+    return call, lambda: None
+
+
+def http_driver(app):
+    server = make_server("127.0.0.1", 0, app, threaded=False, request_handler=QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    def call(method, path, body):
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=60)
+        payload = json.dumps(body) if body is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        connection.request(method, path, body=payload, headers=headers)
+        response = connection.getresponse()
+        data = response.read()
+        connection.close()
+        try:
+            return response.status, json.loads(data)
+        except ValueError:
+            return response.status, None
+    return call, server.shutdown
+
+
+DRIVERS = {
+    "client": client_driver,
+    "http": http_driver,
+}
+
+
+def initial_state(app):
+    with app.app_context():
+        from models import Category, Question
+        ids = [question_id for question_id, in db.session.query(Question.id).order_by(Question.id)]
+        category_id = db.session.query(Category.id).order_by(Category.id).first()[0]
+    per_page = 10
+    return {
+        "category_id": category_id,
+        "middle_id": ids[len(ids) // 2],
+        "last_page": max(1, (len(ids) + per_page - 1) // per_page),
+    }
+
+
+def run(app, driver_name, iterations, counter):
+    call, stop = DRIVERS[driver_name](app)
+    state = initial_state(app)
+    results = {}
+    try:
+        for scenario in SCENARIOS:
+            latencies = []
+            queries = []
+            failures = 0
+            # one unmeasured call first, so cold caches don't skew the numbers
+            method, path, body = scenario.request(state)
+            scenario.after(state, call(method, path, body)[1])
+            started = time.perf_counter()
+            for _ in range(iterations):
+                method, path, body = scenario.request(state)
+                before = counter.count
+                start = time.perf_counter()
+                status, data = call(method, path, body)
+                latencies.append(time.perf_counter() - start)
+                queries.append(counter.count - before)
+                if status >= 400:
+                    failures += 1
+                scenario.after(state, data)
+            results[scenario.name] = dict(summarize(latencies, queries, time.perf_counter() - started),
+                                          failures=failures)
+    finally:
+        stop()
+    return results
+
+
+def print_report(driver_name, results):
+    print("\n[{}]".format(driver_name))
+    print("{:<34} {:>9} {:>9} {:>9} {:>9} {:>8} {:>6}".format(
+        "route", "req/s", "p50 ms", "p95 ms", "p99 ms", "queries", "fail"))
+    for name, row in results.items():
+        print("{:<34} {:>9.1f} {:>9.2f} {:>9.2f} {:>9.2f} {:>8.1f} {:>6}".format(
+            name, row["rps"], row["p50_ms"], row["p95_ms"], row["p99_ms"], row["queries"], row["failures"]))
+
+
+def compare(results, baseline, tolerance):
+    """Return the regressions of `results` against `baseline` as messages."""
+    regressions = []
+    for driver_name, routes in results["drivers"].items():
+        for name, row in routes.items():
+            before = baseline.get("drivers", {}).get(driver_name, {}).get(name)
+            if before is None:
+                continue
+            if row["p50_ms"] > before["p50_ms"] * (1 + tolerance):
+                regressions.append("{} {}: p50 {:.2f} ms, baseline {:.2f} ms".format(
+                    driver_name, name, row["p50_ms"], before["p50_ms"]))
+            if row["queries"] > before["queries"] + 1e-9:
+                regressions.append("{} {}: {:.1f} queries per request, baseline {:.1f}".format(
+                    driver_name, name, row["queries"], before["queries"]))
+    return regressions
+
+
+def benchmark(database, questions, categories, iterations, drivers=("client", "http"),
+              reseed=False, response_cache=False):
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": database,
+        "DATABASE_CREATE_ALL": True,
+        "RESPONSE_CACHE_ENABLED": response_cache,
+        # the search scenario repeats one term from one client; without the
+        # caches it measures the query itself
+        "SEARCH_RESULT_TTL": 5 if response_cache else 0,
+        "SEARCH_RATE_LIMIT": 0,
+    })
+    with app.app_context():
+        started = time.perf_counter()
+        seeded = dataset.seed(questions, categories, reseed=reseed)
+        seed_seconds = time.perf_counter() - started
+        counter = QueryCounter(db.engine)
+    results = {
+        "database": database.split("@")[-1],
+        "questions": questions,
+        "categories": categories,
+        "iterations": iterations,
+        "seed_seconds": seed_seconds if seeded else None,
+        "drivers": {},
+    }
+    for driver_name in drivers:
+        results["drivers"][driver_name] = run(app, driver_name, iterations, counter)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every trivia API route.")
+    parser.add_argument("--database", help="database URI, a fresh SQLite file by default")
+    parser.add_argument("--questions", type=int, default=10000)
+    parser.add_argument("--categories", type=int, default=6)
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS, help="requests per route")
+    parser.add_argument("--driver", choices=sorted(DRIVERS), action="append",
+                        help="test client, real HTTP server, or both (default)")
+    parser.add_argument("--reseed", action="store_true",
+                        help="delete every existing question and category before seeding")
+    parser.add_argument("--response-cache", action="store_true", help="keep the response and search result caches enabled")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="baseline results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p50 slowdown, 0.25 = 25%%")
+    args = parser.parse_args(argv)
+
+    database = args.database
+    if database is None:
+        directory = tempfile.mkdtemp(prefix="trivia-bench-")
+        database = "sqlite:///" + os.path.join(directory, "trivia.db")
+
+    results = benchmark(database, args.questions, args.categories, args.iterations,
+                        drivers=args.driver or ("client", "http"), reseed=args.reseed,
+                        response_cache=args.response_cache)
+    if results["seed_seconds"] is not None:
+        print("seeded {} questions in {:.1f}s".format(args.questions, results["seed_seconds"]))
+    for driver_name, routes in results["drivers"].items():
+        print_report(driver_name, routes)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for message in regressions:
+            print("REGRESSION " + message)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
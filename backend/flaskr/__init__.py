@@ -1,22 +1,229 @@
-from http.client import HTTPException
-from multiprocessing import AuthenticationError
 import os
-from sunau import AUDIO_FILE_ENCODING_ADPCM_G721
-from flask import Flask, request, abort, jsonify
-from flask_sqlalchemy import SQLAlchemy
+import tempfile
+
+from flask import Flask, Response, request, abort, jsonify, stream_with_context
 from flask_cors import CORS
-import random
 
-from models import setup_db, Question, Category
+import migrations
+from models import setup_db, notify, subscribe, Question
+from . import batch, bulk, changes, jobs, paging, query_plans, quiz, search, serialization
+from .categories import CategoryCache
+from .compression import Compressor
+from .conditional import ConditionalGet
+from .counters import QuestionCounter
+from .metrics import RequestMetrics
+from .ratelimit import TokenBucketLimiter
+from .store import QuestionStore
+from .response_cache import MemoryBackend, ResponseCache
+from .validation import InvalidQuestion, validate_question
 
 QUESTIONS_PER_PAGE = 10
+CATEGORY_CACHE_TTL = 300
+QUIZ_INDEX_TTL = 300
+QUESTION_COUNT_TTL = 300
+QUIZ_SESSION_IDLE_TIMEOUT = 1800
+QUIZ_SESSION_LIMIT = 10000
+QUESTION_CACHE_TTL = 300
+QUESTION_CACHE_SIZE = 50000
+QUESTION_STORE_TTL = 300
+SEARCH_INDEX_TTL = 300
+SEARCH_RESULT_TTL = 5
+SEARCH_RESULT_CACHE_SIZE = 1024
+# searches a client may send per second, and in a burst
+SEARCH_RATE_LIMIT = 5
+SEARCH_RATE_BURST = 20
+RESPONSE_CACHE_TTL = 60
+RESPONSE_CACHE_SIZE = 1024
+# read endpoints whose responses are cached until the next write
+CACHED_ENDPOINTS = ("retrieve_categories", "retrieve_questions", "retrieve_questions_by_category")
+# listings answered with 304 while no question was written, see flaskr.conditional
+CONDITIONAL_ENDPOINTS = ("retrieve_questions", "retrieve_questions_by_category")
+# bodies smaller than this are sent uncompressed
+COMPRESSION_MIN_SIZE = 1024
+JOB_WORKERS = 2
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY = 5
+# seconds after its start a running job is assumed to have lost its process
+JOB_LEASE_SECONDS = 3600
+# jobs POST /jobs may start; imports are submitted by POST /questions/import
+MAINTENANCE_JOBS = ("warm_caches", "rebuild_indexes")
+# most SQL statements a request to each endpoint may issue with cold
+# caches, see flaskr.metrics; batch writes, import, export and the
+# long-polling change feed scale with their input and have no budget.
+# Counted on PostgreSQL, where every question write also takes the change
+# log lock (models.record_changes)
+QUERY_BUDGETS = {
+    "retrieve_categories": 1,
+    "retrieve_questions": 5,
+    "retrieve_questions_by_category": 4,
+    "create_question": 4,
+    "delete_question": 5,
+    "delete_questions_batch": 4,
+    "request_quizes": 3,
+    "create_quiz_session": 1,
+    "next_quiz_question": 1,
+    "finish_quiz_session": 0,
+    "create_job": 1,
+    "retrieve_job": 1,
+}
+# POST endpoints that only read the database, served by read replicas like
+# GET requests, see replicas.py
+REPLICA_READ_ENDPOINTS = ("request_quizes", "create_quiz_session", "next_quiz_question", "finish_quiz_session")
 
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__, instance_relative_config=True)
+    if test_config is not None:
+        app.config.from_mapping(test_config)
+    app.json_encoder = serialization.FastJSONEncoder
     setup_db(app)
     # app.run(debug=True)
 
+    # first hooks registered, so they time everything else
+    request_metrics = RequestMetrics(
+        budgets=dict(QUERY_BUDGETS, **app.config.get("QUERY_BUDGETS", {})),
+        enforce=app.config.get("QUERY_BUDGET_ENFORCE", app.testing or app.debug))
+    request_metrics.init_app(app)
+    app.extensions["request_metrics"] = request_metrics
+
+    read_replicas = app.extensions.get("read_replicas")
+    if read_replicas is not None:
+        read_replicas.init_app(app, read_endpoints=REPLICA_READ_ENDPOINTS)
+        subscribe(app, read_replicas.on_write)
+
+    # shared by every handler below; dropped whenever a category is written
+    category_cache = CategoryCache(ttl=app.config.get("CATEGORY_CACHE_TTL", CATEGORY_CACHE_TTL))
+    subscribe(app, category_cache.on_write)
+    app.extensions["category_cache"] = category_cache
+
+    question_counter = QuestionCounter(ttl=app.config.get("QUESTION_COUNT_TTL", QUESTION_COUNT_TTL))
+    subscribe(app, question_counter.on_write)
+    app.extensions["question_counter"] = question_counter
+
+    # question ids per category, sampled in memory by /quizzes
+    question_index = quiz.QuestionIndex(ttl=app.config.get("QUIZ_INDEX_TTL", QUIZ_INDEX_TTL))
+    subscribe(app, question_index.on_write)
+    app.extensions["question_index"] = question_index
+
+    # question rows by id, so drawing a quiz question is a memory lookup
+    question_cache = quiz.QuestionCache(
+        ttl=app.config.get("QUESTION_CACHE_TTL", QUESTION_CACHE_TTL),
+        max_entries=app.config.get("QUESTION_CACHE_SIZE", QUESTION_CACHE_SIZE))
+    subscribe(app, question_cache.on_write)
+    app.extensions["question_cache"] = question_cache
+
+    # optional copy of the whole questions table serving the hot reads
+    question_store = None
+    if app.config.get("QUESTION_STORE_ENABLED", False):
+        question_store = QuestionStore(ttl=app.config.get("QUESTION_STORE_TTL", QUESTION_STORE_TTL))
+        subscribe(app, question_store.on_write)
+    app.extensions["question_store"] = question_store
+    # where quiz draws read questions from
+    quiz_questions = question_store if question_store is not None else question_cache
+
+    # subscribed after the index, whose load they are built from
+    quiz_decks = quiz.SharedDecks(question_index)
+    subscribe(app, quiz_decks.on_write)
+    app.extensions["quiz_decks"] = quiz_decks
+
+    quiz_sessions = quiz.QuizSessionStore(
+        question_index,
+        idle_timeout=app.config.get("QUIZ_SESSION_IDLE_TIMEOUT", QUIZ_SESSION_IDLE_TIMEOUT),
+        max_sessions=app.config.get("QUIZ_SESSION_LIMIT", QUIZ_SESSION_LIMIT),
+        decks=quiz_decks)
+    app.extensions["quiz_sessions"] = quiz_sessions
+
+    # full-text index on PostgreSQL, in-process inverted index elsewhere
+    question_search = search.create_search(
+        app,
+        backend=app.config.get("SEARCH_BACKEND", "auto"),
+        ttl=app.config.get("SEARCH_INDEX_TTL", SEARCH_INDEX_TTL),
+        result_ttl=app.config.get("SEARCH_RESULT_TTL", SEARCH_RESULT_TTL),
+        max_results=app.config.get("SEARCH_RESULT_CACHE_SIZE", SEARCH_RESULT_CACHE_SIZE))
+    subscribe(app, question_search.on_write)
+    app.extensions["question_search"] = question_search
+
+    # a falsy SEARCH_RATE_LIMIT turns limiting off
+    search_limiter = None
+    if app.config.get("SEARCH_RATE_LIMIT", SEARCH_RATE_LIMIT):
+        search_limiter = TokenBucketLimiter(
+            rate=app.config.get("SEARCH_RATE_LIMIT", SEARCH_RATE_LIMIT),
+            burst=app.config.get("SEARCH_RATE_BURST", SEARCH_RATE_BURST))
+    app.extensions["search_limiter"] = search_limiter
+
+    # wakes requests long-polling GET /questions/changes
+    change_waiter = changes.ChangeWaiter()
+    subscribe(app, change_waiter.on_write)
+    app.extensions["change_waiter"] = change_waiter
+
+    bulk.register_commands(app, category_cache.exists)
+    changes.register_commands(app)
+    migrations.register_commands(app)
+    query_plans.register_commands(app)
+
+    # RESPONSE_CACHE_BACKEND may hold any response_cache.CacheBackend,
+    # e.g. one shared by all workers; defaults to a per-process LRU
+    cache_backend = app.config.get("RESPONSE_CACHE_BACKEND")
+    if cache_backend is None:
+        cache_backend = MemoryBackend(max_entries=app.config.get("RESPONSE_CACHE_SIZE", RESPONSE_CACHE_SIZE))
+    compressor = None
+    if app.config.get("COMPRESSION_ENABLED", True):
+        compressor = Compressor(min_size=app.config.get("COMPRESSION_MIN_SIZE", COMPRESSION_MIN_SIZE))
+    response_cache = ResponseCache(
+        backend=cache_backend,
+        ttl=app.config.get("RESPONSE_CACHE_TTL", RESPONSE_CACHE_TTL),
+        endpoints=CACHED_ENDPOINTS if app.config.get("RESPONSE_CACHE_ENABLED", True) else (),
+        variant=compressor.negotiate if compressor is not None else None)
+    response_cache.init_app(app)
+    subscribe(app, response_cache.on_write)
+    app.extensions["response_cache"] = response_cache
+
+    # validators from the question change log, shared by every worker;
+    # registered after the response cache, whose hits carry their own
+    conditional_get = ConditionalGet(category_cache.etag, endpoints=CONDITIONAL_ENDPOINTS)
+    conditional_get.init_app(app)
+    app.extensions["conditional_get"] = conditional_get
+
+    # slow maintenance runs off the request path, see flaskr/jobs.py
+    job_queue = jobs.JobQueue(
+        app,
+        workers=app.config.get("JOB_WORKERS", JOB_WORKERS),
+        max_attempts=app.config.get("JOB_MAX_ATTEMPTS", JOB_MAX_ATTEMPTS),
+        retry_delay=app.config.get("JOB_RETRY_DELAY", JOB_RETRY_DELAY),
+        lease_seconds=app.config.get("JOB_LEASE_SECONDS", JOB_LEASE_SECONDS))
+    app.extensions["jobs"] = job_queue
+    jobs.register_commands(app, job_queue)
+
+    def warm_caches():
+        """Load every in-process cache now rather than on the first requests."""
+        question_search.warm()
+        question_index.generation()
+        if question_store is not None:
+            question_store.count()
+        return {
+            "categories": len(category_cache.categories()),
+            "questions": question_counter.value(),
+        }
+
+    def rebuild_indexes():
+        """Drop all state derived from the questions table, as after a bulk import, and load it again."""
+        notify(Question.__tablename__, "reload", None)
+        category_cache.invalidate()
+        question_counter.invalidate()
+        return warm_caches()
+
+    def import_file(path, fmt):
+        try:
+            with open(path, encoding="utf-8") as source:
+                return bulk.import_questions(bulk.READERS[fmt](source), category_cache.exists)
+        finally:
+            os.remove(path)
+
+    job_queue.register("warm_caches", warm_caches)
+    job_queue.register("rebuild_indexes", rebuild_indexes)
+    # batches committed before a failure would be inserted again by a retry
+    job_queue.register("import_questions", import_file, max_attempts=1)
+
     """
     @TODO: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
     """
@@ -31,7 +238,11 @@ def create_app(test_config=None):
     def after_request(response):
         response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization')
         response.headers.add('Access-Control-Allow-Headers', 'GET, POST, PATCH, DELETE, OPTIONS')
-        return response
+        # runs before the response cache stores the response, so it keeps
+        # the encoded body and its validators
+        encoding = compressor.choose(request, response) if compressor is not None else None
+        response = conditional_get.apply(response, encoding)
+        return compressor.compress(response, encoding) if encoding is not None else response
 
 
     """
@@ -42,19 +253,25 @@ def create_app(test_config=None):
     @app.route("/categories", methods=['GET'])
     def retrieve_categories():
         try:
-            categories = Category.query.order_by(Category.id).all()
-            categories_formated={categorie.format()['id']: categorie.format()['type'] for categorie in categories}
+            categories_formated, etag = category_cache.get()
 
             if len(categories_formated) == 0:
                 abort(404)
-                
-            return jsonify(
+
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+
+            response = jsonify(
                 {
                     "success": True,
                     "categories": categories_formated,
                 }
             )
-        except (AuthenticationError, MemoryError): # included for future use case
+            response.set_etag(etag)
+            return response
+        except MemoryError:
             abort(422)
         except Exception as e:
             if e.code == 404:
@@ -78,23 +295,31 @@ def create_app(test_config=None):
     @app.route("/questions")
     def retrieve_questions():
         try:
-            selection = Question.query.order_by(
-            Question.id).paginate(per_page=QUESTIONS_PER_PAGE).items
-        
-            current_questions = [question.format() for question in selection]
-            categories = Category.query.order_by(Category.id).all()
-            categories_formated={categorie.format()['id']: categorie.format()['type'] for categorie in categories}
+            # ?cursor= / ?after_id= seek on Question.id; ?page= is resolved
+            # to an anchor id and then served by the same seek.
+            fields = serialization.parse_fields(request.args.get("fields"))
+            if question_store is not None:
+                selection, next_cursor = question_store.page_from_request(
+                    request.args, fields, QUESTIONS_PER_PAGE)
+                total = question_store.count()
+            else:
+                selection, next_cursor = paging.page_from_request(
+                    request.args, serialization.question_query(fields), Question.id, QUESTIONS_PER_PAGE)
+                total = question_counter.value()
+
+            current_questions = serialization.format_rows(selection, fields)
 
             return jsonify(
                 {
                     "success": True,
                     "questions": current_questions,
-                    "categories": categories_formated,
+                    "categories": category_cache.categories(),
                     "currentCategory": None,
-                    "total_questions": len(Question.query.order_by(Question.id).all()),
+                    "total_questions": total,
+                    "next_cursor": next_cursor,
                 }
             )
-        except (AuthenticationError, MemoryError, TypeError):  # included for future use case
+        except (MemoryError, TypeError):
             abort(422)
         except Exception:
             abort(422)
@@ -109,6 +334,20 @@ def create_app(test_config=None):
     This removal will persist in the database and when you refresh the page.
     """
 
+    def write_extras(total_key):
+        """
+        The optional parts of a write response, requested with
+        ?include=page,total: the first page of questions and the total.
+        """
+        include = set(request.args.get("include", "").split(","))
+        extras = {}
+        if "page" in include:
+            selection, _ = paging.seek(serialization.question_query(), Question.id, None, QUESTIONS_PER_PAGE)
+            extras["questions"] = serialization.format_rows(selection)
+        if "total" in include:
+            extras[total_key] = question_counter.value()
+        return extras
+
     @app.route("/questions/<int:question_id>", methods=["DELETE"])
     def delete_question(question_id):
         try:
@@ -118,23 +357,16 @@ def create_app(test_config=None):
                 abort(404)
 
             question.delete()
-            
-
-            selection = Question.query.order_by(
-                Question.id).paginate(per_page=QUESTIONS_PER_PAGE).items
-
-            current_questions = [question.format() for question in selection]
 
             return jsonify(
                 {
                     "success": True,
                     "deleted": question_id,
-                    "questions": current_questions,
-                    "totalQuestions": len(Question.query.order_by(Question.id).all()),
+                    **write_extras("totalQuestions"),
                 }
             )
 
-        except (AuthenticationError, MemoryError, TypeError):  # included for future use case
+        except (MemoryError, TypeError):
             abort(422)
         except Exception as e:
             if e.code == 404:
@@ -156,31 +388,26 @@ def create_app(test_config=None):
 
     @app.route("/questions", methods=["POST"])
     def create_question():
-        new_question = ""
-        new_answer = ""
-        new_difficulty = None
-        new_category = None
         search_term = None
         try:
             body = request.get_json()
             search_term = body.get("searchTerm", None)
-            body = request.get_json()
-            new_question = body.get("question", "")
-            new_answer = body.get("answer", "")
-            new_difficulty = body.get("difficulty", None)
-            new_category = body.get("category", None)
             if search_term:
-                selection = Question.query.order_by(Question.id).filter(
-                    Question.question.ilike("%{}%".format(search_term))
-                ).paginate(per_page=QUESTIONS_PER_PAGE).items
-                current_questions = [question.format()
-                                    for question in selection]
+                page = int(body.get("page", request.args.get("page", 1)))
+                if page < 1:
+                    abort(422)
+                if search_limiter is not None:
+                    retry_after = search_limiter.acquire(request.remote_addr)
+                    if retry_after:
+                        abort(429, retry_after)
+                selection, total = question_search.search(search_term, page, QUESTIONS_PER_PAGE)
+                current_questions = serialization.format_rows(selection)
 
                 return jsonify(
                     {
                         "success": True,
                         "questions": current_questions,
-                        "totalQuestions": len(selection),
+                        "totalQuestions": total,
                         "currentCategory": None,
                     }
                 )
@@ -188,43 +415,150 @@ def create_app(test_config=None):
             else:
 
                 # User Input handling
-                if new_question.isspace() or new_answer.isspace() or new_question == "" or new_answer == "":
-                    print("Hello deux")
-                    raise AttributeError(
-                        "Sorry, question, answer, category, and difficulty should not be empty")
-
-                if not isinstance(new_difficulty, int):
-                    print("exception raise two")
-                    raise TypeError("Sorry, difficulty should be an integer")
-                if new_difficulty not in range(1, 6):
-                    print("exception raise two")
-                    raise TypeError("Sorry, difficulty should be an integer between 1 and 5")
-
-                if not isinstance(new_category, int):
-                    abort(422)
-
-                category = Category.query.filter(Category.id == new_category).all()
-                if len(category) == 0:
+                try:
+                    fields = validate_question(body, category_cache.exists)
+                except InvalidQuestion:
                     abort(422)
 
-                question = Question(question=new_question,
-                                answer=new_answer, difficulty=new_difficulty, category=new_category)
-                question.insert()
-                selection = Question.query.order_by(Question.id).paginate(
-                    per_page=QUESTIONS_PER_PAGE).items
-                current_questions = [question.format()
-                                        for question in selection]
+                record = Question(**fields).insert()
 
                 return jsonify(
                     {
                         "success": True,
-                        "created": question.id,
-                        "questions": current_questions,
-                        "total_questions": len(Question.query.order_by(Question.id).all()),
+                        "created": record["id"],
+                        "question": record,
+                        **write_extras("total_questions"),
                     }
                 )
 
-        except (AuthenticationError, MemoryError, TypeError):  # included for future use case
+        except (MemoryError, TypeError):
+            abort(422)
+        except Exception as e:
+            if getattr(e, "code", None) == 429:
+                raise
+            abort(422)
+
+    """
+    Batch create and delete, each applied in a single transaction, see
+    flaskr/batch.py.
+    """
+
+    @app.route("/questions/batch", methods=["POST"])
+    def create_questions_batch():
+        try:
+            body = request.get_json()
+            items = body.get("questions", None)
+            if not isinstance(items, list):
+                abort(422)
+
+            created, results = batch.create_questions(items, category_cache.exists)
+
+            return jsonify(
+                {
+                    "success": created,
+                    "created": [result["id"] for result in results if result["status"] == "created"],
+                    "results": results,
+                }
+            ), 200 if created else 422
+
+        except (MemoryError, TypeError):
+            abort(422)
+        except Exception:
+            abort(422)
+
+    @app.route("/questions", methods=["DELETE"])
+    def delete_questions_batch():
+        try:
+            if request.args.get("ids"):
+                ids = request.args["ids"].split(",")
+            else:
+                ids = (request.get_json(silent=True) or {}).get("ids", None)
+            if not ids or not isinstance(ids, list):
+                abort(422)
+
+            results = batch.delete_questions(ids)
+
+            return jsonify(
+                {
+                    "success": True,
+                    "deleted": [result["id"] for result in results if result["status"] == "deleted"],
+                    "results": results,
+                }
+            )
+
+        except (MemoryError, TypeError):
+            abort(422)
+        except Exception:
+            abort(422)
+
+    """
+    Bulk import and streaming export of the question bank, see flaskr/bulk.py.
+    """
+
+    @app.route("/questions/import", methods=["POST"])
+    def import_questions():
+        try:
+            fmt = "csv" if request.mimetype == "text/csv" else "ndjson"
+            if request.args.get("async", "").lower() in ("1", "true", "yes"):
+                # spooled to a file the job reads and deletes once imported
+                handle, path = tempfile.mkstemp(prefix="trivia-import-", suffix="." + fmt,
+                                                dir=app.config.get("JOB_FILES_DIR"))
+                with os.fdopen(handle, "wb") as spool:
+                    while True:
+                        chunk = request.stream.read(65536)
+                        if not chunk:
+                            break
+                        spool.write(chunk)
+                job = job_queue.submit("import_questions", {"path": path, "fmt": fmt})
+                return jsonify({"success": True, "job": job}), 202
+
+            rows = bulk.READERS[fmt](request.stream)
+            report = bulk.import_questions(rows, category_cache.exists)
+
+            return jsonify(
+                {
+                    "success": True,
+                    "imported": report["imported"],
+                    "rejected": report["rejected"],
+                    "errors": report["errors"],
+                }
+            )
+
+        except (MemoryError, TypeError):
+            abort(422)
+        except Exception:
+            abort(422)
+
+    @app.route("/questions/export", methods=["GET"])
+    def export_questions():
+        fmt = request.args.get("format", "ndjson")
+        if fmt not in bulk.FORMATS:
+            abort(400)
+
+        lines = bulk.WRITERS[fmt](bulk.export_rows())
+        return Response(stream_with_context(lines), mimetype=bulk.MIMETYPES[fmt])
+
+    @app.route("/questions/changes", methods=["GET"])
+    def retrieve_question_changes():
+        try:
+            since = int(request.args.get("since", 0))
+            limit = int(request.args.get("limit", changes.DEFAULT_LIMIT))
+            wait = float(request.args.get("wait", 0))
+            if since < 0 or not 0 < limit <= changes.MAX_LIMIT or wait < 0:
+                abort(422)
+
+            selection, more, reset = changes.poll(change_waiter, since, limit, wait)
+            return jsonify(
+                {
+                    "success": True,
+                    "changes": [change.format() for change in selection],
+                    # the since of the next request
+                    "version": selection[-1].version if selection else since,
+                    "more": more,
+                    "reset": reset,
+                }
+            )
+        except (MemoryError, TypeError):
             abort(422)
         except Exception:
             abort(422)
@@ -260,7 +594,7 @@ def create_app(test_config=None):
     #             }
     #         )
 
-    #     except (AuthenticationError, MemoryError, TypeError):  # included for future use case
+    #     except (MemoryError, TypeError):
     #         abort(422)
     #     except Exception:
     #         abort(422)
@@ -277,26 +611,41 @@ def create_app(test_config=None):
     def retrieve_questions_by_category(category_id):
         questions = list()
         try:
-            questions = Question.query.join(Category, Question.category == Category.id).filter(
-                Category.id == category_id).all()
+            if not category_cache.exists(category_id):
+                abort(404)
+
+            # same paging arguments as GET /questions
+            fields = serialization.parse_fields(request.args.get("fields"))
+            try:
+                if question_store is not None:
+                    questions, next_cursor = question_store.page_from_request(
+                        request.args, fields, QUESTIONS_PER_PAGE, category_id=category_id)
+                else:
+                    query = serialization.question_query(fields).filter(Question.category == category_id)
+                    questions, next_cursor = paging.page_from_request(
+                        request.args, query, Question.id, QUESTIONS_PER_PAGE)
+            except LookupError:
+                abort(404)
 
             if not questions:
                 abort(404)
 
-            questions = [question.format() for question in questions]
+            questions = serialization.format_rows(questions, fields)
             return jsonify(
                 {
                     "success": True,
                     "questions": questions,
                     "currentCategory": category_id,
-                    "totalQuestions": len(Question.query.order_by(Question.id).all()),
+                    # kept up to date by the quiz index, no COUNT query
+                    "totalQuestions": question_index.size(category_id),
+                    "next_cursor": next_cursor,
                 }
             )
 
-        except (AuthenticationError, MemoryError, TypeError):  # included for future use case
+        except (MemoryError, TypeError):
             abort(422)
         except Exception as e:
-            if e.code == 404:
+            if getattr(e, "code", None) == 404:
                 abort(e.code)
             else:
                 abort(422)
@@ -313,43 +662,199 @@ def create_app(test_config=None):
     and shown whether they were correct or not.
     """
 
+    def quiz_difficulty(body):
+        """
+        The `difficulty` and `adaptive` options of a quiz request; raises
+        ValueError for a difficulty outside 1-5 or an adaptive flag that is
+        not a JSON boolean.
+        """
+        difficulty = body.get("difficulty", None)
+        if difficulty is not None:
+            difficulty = int(difficulty)
+            if difficulty not in quiz.DIFFICULTIES:
+                raise ValueError("difficulty should be between 1 and 5")
+        adaptive = body.get("adaptive", False)
+        if not isinstance(adaptive, bool):
+            raise ValueError("adaptive should be true or false")
+        return difficulty, adaptive
+
     @app.route("/quizzes", methods=["POST"])
     def request_quizes():
 
         try:
             body = request.get_json()
-            previous_questions = body.get("previous_questions", None)
+            previous_questions = body.get("previous_questions", None) or []
             quiz_category = body.get("quiz_category", None)
-            question = 0
+            category_id = quiz.ALL_CATEGORIES
             if quiz_category != None:
+                category_id = int(quiz_category.get('id') or quiz.ALL_CATEGORIES)
+            difficulty, adaptive = quiz_difficulty(body)
 
-                rand = random.randrange(0, len(Category.query.join(
-                    Question, Category.id == Question.category).filter(Category.id == quiz_category['id']).one().questions))
+            if category_id != quiz.ALL_CATEGORIES and not category_cache.exists(category_id):
+                abort(404)
+
+            if adaptive:
+                # the client sends back the level it was given and whether
+                # the previous question was answered correctly
+                difficulty = difficulty or quiz.START_DIFFICULTY
+                correct = body.get("correct", None)
+                if correct is not None and previous_questions:
+                    difficulty = quiz.next_difficulty(difficulty, bool(correct))
+
+            # None once every question of the category has been played; the
+            # frontend ends the quiz on an empty question
+            question = quiz.draw_question(
+                question_index, quiz_questions, category_id, previous_questions,
+                difficulty=difficulty, nearest=adaptive)
+            return jsonify(
+                {
+                    "success": True,
+                    "question": question,
+                    "difficulty": difficulty,
+                }
+            )
 
-                question = Category.query.join(Question, Category.id == Question.category).filter(
-                    Category.id == quiz_category['id']).filter(Question.id.notin_(previous_questions)).one().questions[rand]
+        except (MemoryError, TypeError):
+            abort(422)
+        except Exception as e:
+            if getattr(e, "code", None) == 404:
+                abort(e.code)
             else:
-                rand = random.randrange(0, Question.query.count()) 
-                question = Question.query.filter(
-                    Question.id.notin_(previous_questions)).all()[rand]
-            if question != 0:
-                return jsonify(
-                    {
-                        "success": True,
-                        "question": question.format(),
-                    }
-                )
+                abort(422)
+
+    """
+    Quiz sessions keep the questions already played on the server, so the
+    client only sends a session id each round instead of previous_questions.
+    """
+
+    @app.route("/quizzes/sessions", methods=["POST"])
+    def create_quiz_session():
+        try:
+            body = request.get_json() or {}
+            quiz_category = body.get("quiz_category", None)
+            category_id = quiz.ALL_CATEGORIES
+            if quiz_category != None:
+                category_id = int(quiz_category.get('id') or quiz.ALL_CATEGORIES)
+            difficulty, adaptive = quiz_difficulty(body)
+
+            session = quiz_sessions.create(category_id, difficulty, adaptive)
+            if session is None:
+                abort(404)
+
+            return jsonify(
+                {
+                    "success": True,
+                    "session": session.format(),
+                }
+            )
+
+        except (MemoryError, TypeError):
+            abort(422)
+        except Exception as e:
+            if getattr(e, "code", None) == 404:
+                abort(e.code)
             else:
+                abort(422)
+
+    @app.route("/quizzes/sessions/<session_id>/next", methods=["POST"])
+    def next_quiz_question(session_id):
+        try:
+            # {"correct": true|false} about the previous question moves the
+            # level of an adaptive session
+            correct = (request.get_json(silent=True) or {}).get("correct", None)
+            question = quiz.deal_question(
+                quiz_sessions, quiz_questions, session_id, None if correct is None else bool(correct))
+            session = quiz_sessions.get(session_id)
+
+            return jsonify(
+                {
+                    "success": True,
+                    "question": question,
+                    "session": session.format(),
+                }
+            )
+
+        except KeyError:
+            abort(404)
+        except (MemoryError, TypeError):
+            abort(422)
+        except Exception as e:
+            if getattr(e, "code", None) == 404:
+                abort(e.code)
+            else:
+                abort(422)
+
+    @app.route("/quizzes/sessions/<session_id>", methods=["DELETE"])
+    def finish_quiz_session(session_id):
+        session = quiz_sessions.finish(session_id)
+        if session is None:
+            abort(404)
+
+        return jsonify(
+            {
+                "success": True,
+                "finished": session_id,
+                "session": session.format(),
+            }
+        )
+
+    @app.route("/cache/stats", methods=["GET"])
+    def retrieve_cache_stats():
+        return jsonify(
+            {
+                "success": True,
+                "version": response_cache.version(),
+                **response_cache.stats,
+            }
+        )
+
+    @app.route("/search/stats", methods=["GET"])
+    def retrieve_search_stats():
+        return jsonify(
+            {
+                "success": True,
+                **question_search.stats,
+                **(search_limiter.stats if search_limiter is not None else {}),
+            }
+        )
+
+    @app.route("/jobs", methods=["POST"])
+    def create_job():
+        try:
+            body = request.get_json() or {}
+            kind = body.get("kind")
+            if kind not in MAINTENANCE_JOBS:
+                abort(422)
+            job = job_queue.submit(kind)
+
+            return jsonify({"success": True, "job": job}), 202
+
+        except (MemoryError, TypeError):
+            abort(422)
+        except Exception:
+            abort(422)
+
+    @app.route("/jobs/<int:job_id>", methods=["GET"])
+    def retrieve_job(job_id):
+        try:
+            job = job_queue.get(job_id)
+            if job is None:
                 abort(404)
 
-        except (AuthenticationError, MemoryError, TypeError):  # included for future use case
+            return jsonify({"success": True, "job": job})
+
+        except MemoryError:
             abort(422)
         except Exception as e:
-            if e.code == 404:
+            if getattr(e, "code", None) == 404:
                 abort(e.code)
             else:
                 abort(422)
 
+    @app.route("/metrics", methods=["GET"])
+    def retrieve_metrics():
+        return request_metrics.response()
+
     """
     @TODO:
     Create error handlers for all expected errors
@@ -373,6 +878,14 @@ def create_app(test_config=None):
     def bad_request(error):
         return jsonify({"success": False, "error": 400, "message": "bad request"}), 400
 
+    @app.errorhandler(429)
+    def too_many_requests(error):
+        response = jsonify({"success": False, "error": 429, "message": "too many requests"})
+        # abort(429, seconds) passes the wait as the description
+        if isinstance(error.description, int):
+            response.headers["Retry-After"] = str(error.description)
+        return response, 429
+
     @app.errorhandler(405)
     def not_found(error):
         return (
@@ -0,0 +1,185 @@
+"""
+ASGI serving mode
+
+The app stays a WSGI app: SQLAlchemy 1.3 and psycopg2 have no async API, so
+an async driver cannot be swapped in without changing every handler. This
+adapter puts an asyncio front end in place instead. Connections, keep-alive
+and slow clients are handled by the event loop, and handlers run on a
+bounded thread pool sized to the database pool, so a worker process can
+hold many idle or slow connections without one thread per connection.
+
+    uvicorn --factory flaskr.asgi:create_asgi_app --workers 4
+
+Routes and JSON contracts are the same as under a WSGI server.
+"""
+import asyncio
+import io
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import create_app
+
+# handler threads per process; keep it at or below the database pool size
+# (DATABASE_POOL_SIZE + DATABASE_MAX_OVERFLOW) so requests never queue on
+# the connection pool while holding a thread
+ASGI_THREADS = 10
+# response bytes collected per message for streamed bodies, and how many
+# such blocks may wait for a slow client before the handler thread pauses
+BLOCK_SIZE = 64 * 1024
+QUEUE_BLOCKS = 4
+
+
+def build_environ(scope, body):
+    """Translate an ASGI HTTP scope and its body into a WSGI environ."""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/{}".format(scope.get("http_version", "1.1")),
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+            continue
+        if name == "CONTENT_LENGTH":
+            continue
+        key = "HTTP_" + name
+        environ[key] = environ[key] + "," + value if key in environ else value
+    return environ
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+class AsgiAdapter:
+    """
+    Serve a WSGI app over ASGI.
+
+    Each request is produced start to finish by one pool thread, because
+    Flask's request context and the SQLAlchemy session are thread-local.
+    The thread hands response blocks to the event loop through a bounded
+    queue, so a slow client pauses the producer instead of buffering the
+    whole body.
+    """
+
+    def __init__(self, wsgi_app, threads=ASGI_THREADS):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="trivia-asgi")
+
+    @staticmethod
+    def _next_block(iterator):
+        chunks = []
+        size = 0
+        for chunk in iterator:
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= BLOCK_SIZE:
+                break
+        return b"".join(chunks)
+
+    def _produce(self, environ, emit):
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                                  for name, value in headers]
+
+        try:
+            iterable = self.wsgi_app(environ, start_response)
+        except BaseException as e:
+            emit(e)
+            return
+        try:
+            iterator = iter(iterable)
+            block = self._next_block(iterator)
+            emit({"type": "http.response.start", "status": started["status"], "headers": started["headers"]})
+            while True:
+                following = self._next_block(iterator) if block else b""
+                emit({"type": "http.response.body", "body": block, "more_body": bool(following)})
+                if not following:
+                    break
+                block = following
+        except ClientDisconnected:
+            pass
+        except BaseException as e:
+            emit(e)
+        finally:
+            if hasattr(iterable, "close"):
+                iterable.close()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] != "http":
+            raise ValueError("unsupported ASGI scope type {}".format(scope["type"]))
+
+        body = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            body.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=QUEUE_BLOCKS)
+        closed = threading.Event()
+
+        def emit(message):
+            if closed.is_set():
+                raise ClientDisconnected()
+            asyncio.run_coroutine_threadsafe(queue.put(message), loop).result()
+
+        producer = loop.run_in_executor(self.executor, self._produce, build_environ(scope, b"".join(body)), emit)
+        try:
+            while True:
+                message = await queue.get()
+                if isinstance(message, BaseException):
+                    raise message
+                await send(message)
+                if message["type"] == "http.response.body" and not message["more_body"]:
+                    break
+        finally:
+            closed.set()
+            while not queue.empty():
+                queue.get_nowait()
+            try:
+                await producer
+            except ClientDisconnected:
+                pass
+
+
+def create_asgi_app(test_config=None):
+    app = create_app(test_config)
+    threads = app.config.get("ASGI_THREADS", os.environ.get("ASGI_THREADS", ASGI_THREADS))
+    return AsgiAdapter(app, threads=int(threads))
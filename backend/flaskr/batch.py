@@ -0,0 +1,98 @@
+"""
+Batch writes
+
+Create or delete many questions in one transaction. Creation validates
+every item with the POST /questions rules first and writes nothing unless
+all of them pass; deletion removes whichever of the ids exist. Both report
+one result per item and notify the write listeners once per row after the
+commit, like Question.insert() and delete() do.
+"""
+from models import db, notify, record_changes, Question
+from .serialization import format_rows, question_query
+from .validation import InvalidQuestion, validate_question
+
+BATCH_LIMIT = 1000
+
+
+class BatchTooLarge(ValueError):
+    pass
+
+
+def _check_size(items):
+    if len(items) > BATCH_LIMIT:
+        raise BatchTooLarge("at most {} items per batch".format(BATCH_LIMIT))
+
+
+def validate_all(items, category_exists):
+    """Return (cleaned rows, per-item results); rows is None if any item is invalid."""
+    rows = []
+    results = []
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise InvalidQuestion("item should be an object")
+            rows.append(validate_question(item, category_exists))
+            results.append({"index": index, "status": "valid"})
+        except InvalidQuestion as e:
+            results.append({"index": index, "status": "invalid", "error": str(e)})
+    if any(result["status"] == "invalid" for result in results):
+        return None, results
+    return rows, results
+
+
+def _insert(rows):
+    """Insert rows in the current transaction and return their new ids."""
+    table = Question.__table__
+    if db.session.bind.dialect.name == "postgresql":
+        # a single multi-row INSERT ... RETURNING id
+        result = db.session.execute(table.insert().values(rows).returning(table.c.id))
+        return [row[0] for row in result]
+    questions = [Question(**row) for row in rows]
+    db.session.add_all(questions)
+    db.session.flush()
+    return [question.id for question in questions]
+
+
+def create_questions(items, category_exists):
+    """
+    Validate and insert `items`. Returns (created, results) where created
+    is False and nothing was written if any item failed validation.
+    """
+    _check_size(items)
+    rows, results = validate_all(items, category_exists)
+    if rows is None:
+        return False, results
+    if not rows:
+        return True, results
+    try:
+        ids = _insert(rows)
+        records = [dict(row, id=question_id) for row, question_id in zip(rows, ids)]
+        record_changes('insert', records)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    for result, record in zip(results, records):
+        result.update(status="created", id=record["id"])
+        notify(Question.__tablename__, 'insert', record)
+    return True, results
+
+
+def delete_questions(ids):
+    """Delete the questions with these ids in one statement; returns per-id results."""
+    _check_size(ids)
+    ids = [int(question_id) for question_id in ids]
+    records = format_rows(question_query().filter(Question.id.in_(ids))) if ids else []
+    found = {record["id"]: record for record in records}
+    if found:
+        try:
+            Question.query.filter(Question.id.in_(list(found))).delete(synchronize_session=False)
+            record_changes('delete', list(found.values()))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    for record in found.values():
+        notify(Question.__tablename__, 'delete', record)
+    return [{"id": question_id, "status": "deleted" if question_id in found else "not_found"}
+            for question_id in ids]
@@ -0,0 +1,190 @@
+"""
+Bulk import and streaming export of the question bank
+
+Imports read NDJSON or CSV line by line, validate every row with the rules
+of POST /questions and write the valid ones in batches: COPY on PostgreSQL,
+a single executemany INSERT elsewhere, one commit per batch.
+
+Exports stream rows with yield_per so the whole table is never held in
+memory, neither as ORM objects nor as a response body.
+"""
+import csv
+import io
+import json
+
+import click
+
+from models import db, notify, record_changes, Question
+from .validation import InvalidQuestion, validate_question
+
+IMPORT_BATCH_SIZE = 5000
+EXPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+FIELDS = ("question", "answer", "difficulty", "category")
+EXPORT_FIELDS = ("id",) + FIELDS
+
+FORMATS = ("ndjson", "csv")
+MIMETYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def read_ndjson(lines):
+    """Yield (line number, fields) for each non-blank line; fields is None if malformed."""
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if not line.strip():
+            continue
+        try:
+            fields = json.loads(line)
+        except ValueError:
+            fields = None
+        yield number, fields if isinstance(fields, dict) else None
+
+
+def read_csv(lines):
+    """Yield (line number, fields) for each CSV record after the header row."""
+    lines = (line.decode("utf-8") if isinstance(line, bytes) else line for line in lines)
+    reader = csv.DictReader(lines)
+    for row in reader:
+        fields = dict(row)
+        for key in ("difficulty", "category"):
+            if key in fields:
+                fields[key] = _to_int(fields[key])
+        yield reader.line_num, fields
+
+
+READERS = {
+    "ndjson": read_ndjson,
+    "csv": read_csv,
+}
+
+
+def _copy(batch):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in batch:
+        writer.writerow([row[field] for field in FIELDS])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert(
+        "COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(Question.__tablename__, ", ".join(FIELDS)),
+        buffer)
+
+
+def write_batch(batch):
+    """Insert already validated rows in one statement and commit."""
+    if db.session.bind.dialect.name == "postgresql":
+        _copy(batch)
+    else:
+        db.session.execute(Question.__table__.insert(), batch)
+    db.session.commit()
+
+
+def import_questions(rows, category_exists, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Validate and insert (line number, fields) rows.
+
+    Returns a report with the number of imported and rejected rows and the
+    first MAX_REPORTED_ERRORS errors. Batches already committed stay in the
+    database if a later batch fails, and derived state is told about them
+    before the error propagates.
+    """
+    report = {"imported": 0, "rejected": 0, "errors": []}
+    batch = []
+    try:
+        for number, fields in rows:
+            try:
+                if fields is None:
+                    raise InvalidQuestion("malformed row")
+                batch.append(validate_question(fields, category_exists))
+            except InvalidQuestion as e:
+                report["rejected"] += 1
+                if len(report["errors"]) < MAX_REPORTED_ERRORS:
+                    report["errors"].append({"line": number, "error": str(e)})
+                continue
+            if len(batch) >= batch_size:
+                write_batch(batch)
+                report["imported"] += len(batch)
+                batch = []
+        if batch:
+            write_batch(batch)
+            report["imported"] += len(batch)
+    finally:
+        if report["imported"]:
+            # rows were written without the ORM, derived state has to be
+            # rebuilt; the failed batch, if any, is rolled back first
+            db.session.rollback()
+            record_changes('reload', [None])
+            db.session.commit()
+            notify(Question.__tablename__, 'reload', None)
+    return report
+
+
+def export_rows(batch_size=EXPORT_BATCH_SIZE):
+    """Iterate over every question as a plain tuple, fetched in batches."""
+    columns = [getattr(Question, field) for field in EXPORT_FIELDS]
+    return db.session.query(*columns).order_by(Question.id).yield_per(batch_size)
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_FIELDS, row))) + "\n"
+
+
+def csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+WRITERS = {
+    "ndjson": ndjson_lines,
+    "csv": csv_lines,
+}
+
+
+def format_for(name):
+    return "csv" if name.lower().endswith(".csv") else "ndjson"
+
+
+def register_commands(app, category_exists):
+    """Add `flask import-questions` and `flask export-questions`."""
+
+    @app.cli.command("import-questions")
+    @click.argument("source", type=click.File("r", encoding="utf-8"))
+    @click.option("--format", "fmt", type=click.Choice(FORMATS), default=None,
+                  help="Input format, guessed from the file name by default.")
+    @click.option("--batch-size", default=IMPORT_BATCH_SIZE, show_default=True)
+    def import_command(source, fmt, batch_size):
+        """Import questions from an NDJSON or CSV file ('-' for stdin)."""
+        fmt = fmt or format_for(source.name)
+        report = import_questions(READERS[fmt](source), category_exists, batch_size)
+        for error in report["errors"]:
+            click.echo("line {}: {}".format(error["line"], error["error"]), err=True)
+        click.echo("imported {} questions, rejected {}".format(report["imported"], report["rejected"]))
+
+    @app.cli.command("export-questions")
+    @click.argument("target", type=click.File("w", encoding="utf-8"), default="-")
+    @click.option("--format", "fmt", type=click.Choice(FORMATS), default=None,
+                  help="Output format, guessed from the file name by default.")
+    def export_command(target, fmt):
+        """Export every question as NDJSON or CSV ('-' for stdout)."""
+        fmt = fmt or format_for(target.name)
+        for line in WRITERS[fmt](export_rows()):
+            target.write(line)
@@ -0,0 +1,60 @@
+"""
+Category registry
+
+Categories almost never change, so every handler in create_app shares one
+in-process copy of the id -> type map. The copy expires after a TTL and is
+dropped immediately when a category write is committed.
+"""
+import hashlib
+import json
+import threading
+import time
+
+from models import db, Category
+
+
+class CategoryCache:
+
+    def __init__(self, ttl=300, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._categories = None
+        self._etag = None
+        self._loaded_at = 0.0
+
+    def _load(self):
+        rows = db.session.query(Category.id, Category.type).order_by(Category.id).all()
+        categories = {category_id: category_type for category_id, category_type in rows}
+        payload = json.dumps(categories, sort_keys=True).encode("utf-8")
+        return categories, hashlib.sha1(payload).hexdigest()
+
+    def _fresh(self):
+        return self._categories is not None and self.clock() - self._loaded_at < self.ttl
+
+    def get(self):
+        """Return (categories, etag), reloading from the database if stale."""
+        with self._lock:
+            if not self._fresh():
+                self._categories, self._etag = self._load()
+                self._loaded_at = self.clock()
+            return self._categories, self._etag
+
+    def categories(self):
+        return self.get()[0]
+
+    def etag(self):
+        return self.get()[1]
+
+    def exists(self, category_id):
+        return category_id in self.categories()
+
+    def invalidate(self):
+        with self._lock:
+            self._categories = None
+            self._etag = None
+
+    def on_write(self, table, action, record):
+        """Write listener, see models.subscribe."""
+        if table == Category.__tablename__:
+            self.invalidate()
@@ -0,0 +1,114 @@
+"""
+Question change feed
+
+Every question write appends a row to the question_changes table in the
+same transaction (models.record_changes), numbered by an ever growing
+version. A client that keeps a local copy of the questions asks for the
+changes after the last version it has seen instead of refetching pages:
+
+    GET /questions/changes?since=1200&wait=25
+
+With `wait` the request long-polls: it returns as soon as a change is
+committed, or empty once the wait is over. Writes made by this process wake
+waiting requests at once; writes made by other workers are picked up by
+polling the table every POLL_INTERVAL seconds.
+"""
+import threading
+import time
+
+import click
+from sqlalchemy import func
+
+from models import db, Question, QuestionChange
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+MAX_WAIT = 30
+POLL_INTERVAL = 1.0
+# versions kept by `flask prune-question-changes` unless told otherwise
+CHANGE_LOG_RETENTION = 100000
+
+
+def changes_since(since, limit=DEFAULT_LIMIT):
+    """
+    Return (changes, more, reset): up to `limit` changes after version
+    `since`, whether more follow, and whether versions after `since` were
+    already pruned, in which case the client has to fetch everything again.
+    """
+    rows = QuestionChange.query.filter(QuestionChange.version > since) \
+        .order_by(QuestionChange.version).limit(limit + 1).all()
+    changes = rows[:limit]
+    reset = False
+    if changes and changes[0].version > since + 1:
+        # a gap is either a rolled back write or pruned history
+        oldest = db.session.query(func.min(QuestionChange.version)).scalar()
+        reset = since < oldest - 1
+    return changes, len(rows) > limit, reset
+
+
+def latest_version():
+    return db.session.query(func.max(QuestionChange.version)).scalar() or 0
+
+
+def latest_change():
+    """(version, changed_at) of the last committed change; (0, None) for an empty log."""
+    row = db.session.query(QuestionChange.version, QuestionChange.changed_at) \
+        .order_by(QuestionChange.version.desc()).first()
+    return tuple(row) if row is not None else (0, None)
+
+
+def prune(keep=CHANGE_LOG_RETENTION):
+    """Delete all but the latest `keep` versions; returns the rows deleted."""
+    cutoff = latest_version() - keep
+    deleted = QuestionChange.query.filter(QuestionChange.version <= cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+class ChangeWaiter:
+    """Lets long-polling requests sleep until a question is written."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._generation = 0
+
+    def generation(self):
+        with self._condition:
+            return self._generation
+
+    def wait(self, generation, timeout):
+        """Block until a write after `generation`, or for at most `timeout` seconds."""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._generation != generation, timeout)
+
+    def on_write(self, table, action, record):
+        """Write listener, see models.subscribe."""
+        if table != Question.__tablename__:
+            return
+        with self._condition:
+            self._generation += 1
+            self._condition.notify_all()
+
+
+def poll(waiter, since, limit=DEFAULT_LIMIT, wait=0, interval=POLL_INTERVAL, clock=time.monotonic):
+    """changes_since(), retried until there is a change or `wait` seconds passed."""
+    deadline = clock() + min(wait, MAX_WAIT)
+    while True:
+        generation = waiter.generation()
+        changes, more, reset = changes_since(since, limit)
+        remaining = deadline - clock()
+        if changes or remaining <= 0:
+            return changes, more, reset
+        # hand the connection back to the pool while sleeping
+        db.session.rollback()
+        waiter.wait(generation, min(interval, remaining))
+
+
+def register_commands(app):
+
+    @app.cli.command("prune-question-changes")
+    @click.option("--keep", type=int, default=CHANGE_LOG_RETENTION, show_default=True,
+                  help="number of latest versions to keep")
+    def prune_question_changes(keep):
+        """Delete old entries of the question change log."""
+        click.echo("deleted {} changes".format(prune(keep)))
@@ -0,0 +1,62 @@
+"""
+Response compression
+
+JSON and text responses of at least `min_size` bytes are compressed with
+the best encoding the client accepts: brotli when the `brotli` package is
+installed (`pip install brotli`), otherwise gzip. Smaller bodies gain little
+and cost a round of CPU, so they are sent as is. Streamed bodies (the
+export) and responses already encoded are left alone.
+"""
+import gzip
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is always available
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+
+class Compressor:
+
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=4):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.encodings = ("br", "gzip") if brotli is not None else ("gzip",)
+
+    def negotiate(self, req):
+        """The encoding to use for a client, from its Accept-Encoding, or None."""
+        return req.accept_encodings.best_match(self.encodings)
+
+    def _compressible(self, response):
+        return (response.status_code == 200
+                and (response.mimetype or "").startswith(COMPRESSIBLE_TYPES))
+
+    def choose(self, req, response):
+        """The encoding `response` will be sent with, or None to send it as is."""
+        if "Content-Encoding" in response.headers:
+            # replayed encoded by the response cache
+            return response.headers["Content-Encoding"]
+        if response.is_streamed or response.direct_passthrough:
+            # measuring the body would drain the generator into memory
+            return None
+        if not self._compressible(response):
+            return None
+        response.vary.add("Accept-Encoding")
+        if response.calculate_content_length() < self.min_size:
+            return None
+        return self.negotiate(req)
+
+    def compress(self, response, encoding):
+        """Encode the body of `response` with `encoding` as picked by choose()."""
+        if encoding is None or "Content-Encoding" in response.headers or response.status_code != 200:
+            return response
+        data = response.get_data()
+        if encoding == "br":
+            data = brotli.compress(data, quality=self.brotli_quality)
+        else:
+            data = gzip.compress(data, self.gzip_level)
+        response.set_data(data)
+        response.headers["Content-Encoding"] = encoding
+        return response
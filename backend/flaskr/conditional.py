@@ -0,0 +1,77 @@
+"""
+Conditional GETs
+
+Question listings carry a strong ETag and a Last-Modified date, both
+derived from the last committed change in the question change log (its
+version and time) rather than from the body, so they are known before the
+response is encoded. The log is in the database, so every worker derives
+the same validators, and a write made by any of them changes them. A
+client revalidating with If-None-Match or If-Modified-Since gets an empty
+304 while nothing was written.
+
+The validators are read before the handler runs, so a write racing the
+request can only make them older than the body, never newer. A listing
+replayed from the response cache keeps the validators it was stored with,
+so they always describe the body sent; with a per-process cache that body
+may trail writes of other workers by up to RESPONSE_CACHE_TTL, as the
+cache does anyway.
+
+The ETag also names the content encoding, since a gzip and a plain body
+are different representations, and the categories the listing embeds.
+"""
+import hashlib
+from datetime import timezone
+
+from flask import g, request
+
+from .changes import latest_change
+
+
+class ConditionalGet:
+
+    def __init__(self, categories_etag, endpoints=()):
+        # categories_etag() is the tag of the category map in the listings
+        self.categories_etag = categories_etag
+        self.endpoints = set(endpoints)
+
+    def validators(self, req):
+        """(etag without encoding, last modified or None) of a listing request."""
+        version, changed_at = latest_change()
+        args = "&".join("{}={}".format(name, value) for name, value in sorted(req.args.items(multi=True)))
+        key = "{}:{}:{}?{}".format(version, self.categories_etag(), req.path, args)
+        last_modified = changed_at.replace(tzinfo=timezone.utc) if changed_at is not None else None
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()[:20], last_modified
+
+    def prepare(self):
+        """before_request hook: read the validators ahead of the handler's queries."""
+        if request.method in ("GET", "HEAD") and request.endpoint in self.endpoints:
+            try:
+                g.conditional_validators = self.validators(request)
+            except Exception:
+                # the handler meets the same database error and answers it;
+                # the response goes out without validators
+                g.conditional_validators = None
+
+    def applies(self, response):
+        return (request.method in ("GET", "HEAD") and request.endpoint in self.endpoints
+                and response.status_code == 200 and not response.direct_passthrough)
+
+    def apply(self, response, encoding=None):
+        """Add the validators to a listing and turn it into a 304 when the client's copy is current."""
+        if not self.applies(response):
+            return response
+        if "ETag" not in response.headers:
+            # a cache replay brings the validators it was stored with
+            validators = g.pop("conditional_validators", None)
+            if validators is None:
+                return response
+            tag, last_modified = validators
+            response.set_etag(tag if encoding is None else "{}-{}".format(tag, encoding))
+            if last_modified is not None:
+                response.last_modified = last_modified
+            # revalidate every time instead of trusting heuristic freshness
+            response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+    def init_app(self, app):
+        app.before_request(self.prepare)
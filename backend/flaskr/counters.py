@@ -0,0 +1,50 @@
+"""
+Question counter
+
+Keeps the number of questions in memory so totals never need a scan. The
+value is read once with COUNT(*), then moved by the write listeners, and
+read again after a TTL to pick up writes made by other processes.
+"""
+import threading
+import time
+
+from models import Question
+from .paging import count
+
+
+class QuestionCounter:
+
+    def __init__(self, ttl=300, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._count = None
+        self._counted_at = 0.0
+
+    def value(self):
+        with self._lock:
+            if self._count is not None and self.clock() - self._counted_at < self.ttl:
+                return self._count
+        total = count(Question.id)
+        with self._lock:
+            self._count = total
+            self._counted_at = self.clock()
+        return total
+
+    def invalidate(self):
+        with self._lock:
+            self._count = None
+
+    def on_write(self, table, action, record):
+        """Write listener, see models.subscribe."""
+        if table != Question.__tablename__:
+            return
+        with self._lock:
+            if self._count is None:
+                return
+            if action == 'insert':
+                self._count += 1
+            elif action == 'delete':
+                self._count -= 1
+            elif action == 'reload':
+                self._count = None
@@ -0,0 +1,268 @@
+"""
+Background jobs
+
+Work too slow for a request (rebuilding the in-process indexes, warming
+caches, large imports) is submitted as a job instead: a row in the jobs
+table, run by a small thread pool in the process that accepted it, while
+the request returns 202 with the job at once. Any worker answers
+GET /jobs/<id> from the table.
+
+A job that raises is retried after retry_delay, 2 * retry_delay, ...
+seconds until it has run max_attempts times, then marked failed with the
+error. Kinds that cannot safely run twice, such as imports that commit
+batch by batch, are registered with max_attempts=1. Jobs are claimed with a
+conditional UPDATE, so one never runs twice at the same time. Jobs left
+queued when a process stops (retries waiting for their delay) stay in the
+table and are picked up by
+
+    flask run-jobs                      run due jobs in the foreground, and
+                                        jobs left running past their lease
+    flask run-jobs --requeue-running    also restart every job left running,
+                                        or fail it when no attempt is left
+
+Threads rather than processes: jobs use the app's caches and write
+listeners, which live in the process. When the process exits the pool
+finishes the jobs it has started and those already handed to it. A job of
+a process that died without exiting stays running until its lease of
+lease_seconds from its start has passed; then the next process to start
+its pool, or `flask run-jobs`, requeues it, or marks it failed when it has
+no attempt left.
+"""
+import atexit
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+
+from models import db, Job
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+
+class JobQueue:
+
+    def __init__(self, app, workers=2, max_attempts=3, retry_delay=5.0, lease_seconds=3600, clock=time.time):
+        self.app = app
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease_seconds = lease_seconds
+        self.clock = clock
+        self._functions = {}
+        self._max_attempts = {}
+        self._lock = threading.Lock()
+        self._finished = threading.Condition(self._lock)
+        self._finished_count = 0
+        self._executor = None
+        # retry timers by job id, dropped when they fire
+        self._timers = {}
+        self._closed = False
+
+    def register(self, kind, function, max_attempts=None):
+        """
+        function(**params) runs in an app context and returns a JSON-able
+        result. `max_attempts` overrides the queue's for this kind.
+        """
+        self._functions[kind] = function
+        if max_attempts is not None:
+            self._max_attempts[kind] = max_attempts
+
+    def kinds(self):
+        return sorted(self._functions)
+
+    def submit(self, kind, params=None, max_attempts=None):
+        """Store a job and hand it to the pool; returns its record. Raises ValueError for an unknown kind."""
+        if kind not in self._functions:
+            raise ValueError("unknown job kind: {}".format(kind))
+        job = Job(kind=kind, status=QUEUED, params=json.dumps(params or {}), attempts=0,
+                  max_attempts=max_attempts or self._max_attempts.get(kind, self.max_attempts),
+                  run_after=self.clock(),
+                  created_at=datetime.utcnow())
+        db.session.add(job)
+        db.session.flush()
+        record = job.format()
+        db.session.commit()
+        self._schedule(record["id"], 0)
+        return record
+
+    def get(self, job_id):
+        job = Job.query.get(job_id)
+        return job.format() if job is not None else None
+
+    def _schedule(self, job_id, delay):
+        with self._lock:
+            if self._closed:
+                return
+            if delay > 0:
+                timer = threading.Timer(delay, self._fire, (job_id,))
+                timer.daemon = True
+                self._timers[job_id] = timer
+                timer.start()
+                return
+            if self._executor is None:
+                # started on first use, so booting the app starts no thread
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="trivia-job")
+                atexit.register(self.shutdown)
+                self._executor.submit(self._sweep)
+            self._executor.submit(self._work, job_id)
+
+    def _fire(self, job_id):
+        with self._lock:
+            self._timers.pop(job_id, None)
+        self._schedule(job_id, 0)
+
+    def _sweep(self):
+        # picks up the jobs of processes that died, off the request path
+        with self.app.app_context():
+            try:
+                requeued = self.requeue_abandoned(self._lease_cutoff())
+            except Exception:
+                self.app.logger.exception("abandoned jobs could not be requeued")
+                return
+            finally:
+                db.session.remove()
+        for job_id in requeued:
+            self._schedule(job_id, 0)
+
+    def _work(self, job_id):
+        with self.app.app_context():
+            try:
+                record = self.run(job_id)
+            except Exception:
+                self.app.logger.exception("job %s could not be run", job_id)
+                return
+            finally:
+                db.session.remove()
+        if record is not None and record["status"] == QUEUED:
+            self._schedule(job_id, record["run_after"] - self.clock())
+
+    def _claim(self, job_id):
+        claimed = Job.query.filter(Job.id == job_id, Job.status == QUEUED).update({
+            Job.status: RUNNING,
+            Job.attempts: Job.attempts + 1,
+            Job.started_at: datetime.utcnow(),
+        }, synchronize_session=False)
+        db.session.commit()
+        return claimed == 1
+
+    def run(self, job_id):
+        """
+        Run one attempt of a queued job in the current app context. Returns
+        its record with the due time of a retry, or None when the job is
+        unknown or another worker has it.
+        """
+        if not self._claim(job_id):
+            return None
+        job = Job.query.get(job_id)
+        try:
+            result = self._functions[job.kind](**json.loads(job.params or "{}"))
+        except Exception as e:
+            db.session.rollback()
+            job = Job.query.get(job_id)
+            job.error = "{}: {}".format(type(e).__name__, e)
+            if job.attempts < job.max_attempts and job.kind in self._functions:
+                job.status = QUEUED
+                job.run_after = self.clock() + self.retry_delay * 2 ** (job.attempts - 1)
+                self.app.logger.warning("job %s (%s) failed, retrying: %s", job.id, job.kind, job.error)
+            else:
+                job.status = FAILED
+                job.finished_at = datetime.utcnow()
+                self.app.logger.error("job %s (%s) failed: %s", job.id, job.kind, job.error)
+        else:
+            job.status = SUCCEEDED
+            job.result = json.dumps(result)
+            job.error = None
+            job.finished_at = datetime.utcnow()
+        db.session.commit()
+        record = dict(job.format(), run_after=job.run_after)
+        if job.status in FINISHED:
+            with self._finished:
+                self._finished_count += 1
+                self._finished.notify_all()
+        return record
+
+    def wait(self, job_id, timeout=None):
+        """Block until a job has succeeded or failed, or `timeout` passed; returns its record."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                seen = self._finished_count
+            with self.app.app_context():
+                record = self.get(job_id)
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if record is None or record["status"] in FINISHED or (remaining is not None and remaining <= 0):
+                return record
+            with self._finished:
+                # jobs finished by other processes are only seen by polling
+                self._finished.wait_for(lambda: self._finished_count != seen, min(remaining or 1.0, 1.0))
+
+    def _lease_cutoff(self):
+        return datetime.utcnow() - timedelta(seconds=self.lease_seconds)
+
+    def requeue_abandoned(self, started_before=None):
+        """
+        Requeue the jobs left running that started before `started_before`
+        (all of them when None); those with no attempt left are marked
+        failed instead. Returns the ids of the requeued jobs.
+        """
+        running = Job.query.filter(Job.status == RUNNING)
+        if started_before is not None:
+            running = running.filter(Job.started_at < started_before)
+        rows = running.with_entities(Job.id, Job.attempts, Job.max_attempts).all()
+        requeued = [job_id for job_id, attempts, max_attempts in rows if attempts < max_attempts]
+        # no attempt left, e.g. an import that may have committed part of its rows
+        exhausted = [job_id for job_id, attempts, max_attempts in rows if attempts >= max_attempts]
+        if requeued:
+            Job.query.filter(Job.id.in_(requeued), Job.status == RUNNING).update(
+                {Job.status: QUEUED}, synchronize_session=False)
+        if exhausted:
+            Job.query.filter(Job.id.in_(exhausted), Job.status == RUNNING).update(
+                {Job.status: FAILED, Job.error: "interrupted", Job.finished_at: datetime.utcnow()},
+                synchronize_session=False)
+        if rows:
+            db.session.commit()
+        return requeued
+
+    def run_due(self, requeue_running=False):
+        """Run every due queued job in the foreground, retries included; returns the records."""
+        self.requeue_abandoned(None if requeue_running else self._lease_cutoff())
+        records = []
+        while True:
+            job = Job.query.filter(Job.status == QUEUED).order_by(Job.run_after, Job.id).first()
+            if job is None:
+                return records
+            delay = (job.run_after or 0) - self.clock()
+            if delay > 0:
+                time.sleep(delay)
+            record = self.run(job.id)
+            if record is not None and record["status"] in FINISHED:
+                records.append(record)
+
+    def shutdown(self, wait=True):
+        """Stop taking jobs; with `wait`, finish the ones the pool already has."""
+        with self._lock:
+            self._closed = True
+            for timer in self._timers.values():
+                timer.cancel()
+            self._timers.clear()
+            executor = self._executor
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+def register_commands(app, queue):
+
+    @app.cli.command("run-jobs")
+    @click.option("--requeue-running", is_flag=True,
+                  help="also restart jobs left running; only when no other process runs jobs")
+    def run_jobs(requeue_running):
+        """Run the background jobs that are due, in the foreground."""
+        for record in queue.run_due(requeue_running):
+            click.echo("job {} ({}): {}".format(record["id"], record["kind"], record["status"]))
@@ -0,0 +1,180 @@
+"""
+Request metrics
+
+Records, for every request, the number of SQL statements, the time spent in
+the database and the rows the driver reported, next to the total handling
+time. Each response carries them in a Server-Timing header, e.g.
+
+    Server-Timing: db;dur=1.82;desc="3 queries, 10 rows", app;dur=4.10
+
+and GET /metrics exposes the totals per endpoint in the Prometheus text
+format. Statements are seen through SQLAlchemy engine events, so queries
+issued by any helper count, not only those written in the handlers.
+
+Routes can be given a query budget. When a request issues more statements
+than its endpoint's budget, a warning is logged, or QueryBudgetExceeded is
+raised when budgets are enforced (QUERY_BUDGET_ENFORCE, on by default in
+testing and debug mode), so a test fails as soon as a route regresses.
+
+Rows are the driver's rowcount: PostgreSQL reports rows returned by SELECTs
+as well as rows written, SQLite only rows written. Statements run while a
+streamed body is produced, after the response was started, are not counted.
+"""
+import threading
+import time
+from collections import defaultdict
+
+from flask import Response, current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# upper bounds of the request duration histogram, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestStats:
+    __slots__ = ("started", "queries", "db_seconds", "rows")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+
+
+def current_stats():
+    """Stats of the request being handled, or None outside a request."""
+    if not has_app_context():
+        return None
+    return g.get("request_stats")
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    stats = current_stats()
+    if stats is None:
+        return
+    stats.queries += 1
+    stats.db_seconds += elapsed
+    if cursor.rowcount > 0:
+        stats.rows += cursor.rowcount
+
+
+class EndpointTotals:
+    __slots__ = ("statuses", "buckets", "duration", "queries", "db_seconds", "rows")
+
+    def __init__(self):
+        self.statuses = defaultdict(int)
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.duration = 0.0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+
+
+def _labels(**labels):
+    return "{" + ",".join('{}="{}"'.format(name, str(value).replace('"', '\\"'))
+                          for name, value in labels.items()) + "}"
+
+
+class RequestMetrics:
+
+    def __init__(self, budgets=None, enforce=False):
+        self.budgets = dict(budgets or {})
+        self.enforce = enforce
+        self._lock = threading.Lock()
+        self._totals = defaultdict(EndpointTotals)
+
+    def start(self):
+        """before_request hook."""
+        g.request_stats = RequestStats()
+
+    def finish(self, response):
+        """after_request hook: add the Server-Timing header, record totals, check the budget."""
+        stats = g.pop("request_stats", None)
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - stats.started
+        response.headers.add("Server-Timing", 'db;dur={:.2f};desc="{} queries, {} rows", app;dur={:.2f}'.format(
+            stats.db_seconds * 1e3, stats.queries, stats.rows, elapsed * 1e3))
+
+        endpoint = request.endpoint or "unknown"
+        with self._lock:
+            totals = self._totals[(endpoint, request.method)]
+            totals.statuses[response.status_code] += 1
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if elapsed <= bound:
+                    totals.buckets[i] += 1
+            totals.duration += elapsed
+            totals.queries += stats.queries
+            totals.db_seconds += stats.db_seconds
+            totals.rows += stats.rows
+
+        budget = self.budgets.get(endpoint)
+        if budget is not None and stats.queries > budget:
+            message = "{} {} issued {} queries, budget is {}".format(
+                request.method, request.path, stats.queries, budget)
+            if self.enforce:
+                raise QueryBudgetExceeded(message)
+            current_app.logger.warning(message)
+        return response
+
+    def render(self):
+        """All totals in the Prometheus text exposition format."""
+        with self._lock:
+            totals = sorted(self._totals.items())
+            lines = [
+                "# HELP trivia_http_requests_total Requests handled.",
+                "# TYPE trivia_http_requests_total counter",
+            ]
+            for (endpoint, method), row in totals:
+                for status, value in sorted(row.statuses.items()):
+                    lines.append("trivia_http_requests_total{} {}".format(
+                        _labels(endpoint=endpoint, method=method, status=status), value))
+
+            lines += [
+                "# HELP trivia_http_request_duration_seconds Time spent handling requests.",
+                "# TYPE trivia_http_request_duration_seconds histogram",
+            ]
+            for (endpoint, method), row in totals:
+                count = sum(row.statuses.values())
+                for bound, value in zip(DURATION_BUCKETS, row.buckets):
+                    lines.append("trivia_http_request_duration_seconds_bucket{} {}".format(
+                        _labels(endpoint=endpoint, method=method, le=bound), value))
+                lines.append("trivia_http_request_duration_seconds_bucket{} {}".format(
+                    _labels(endpoint=endpoint, method=method, le="+Inf"), count))
+                lines.append("trivia_http_request_duration_seconds_sum{} {:.6f}".format(
+                    _labels(endpoint=endpoint, method=method), row.duration))
+                lines.append("trivia_http_request_duration_seconds_count{} {}".format(
+                    _labels(endpoint=endpoint, method=method), count))
+
+            for name, kind, help_text, attribute, template in (
+                    ("trivia_db_queries_total", "counter", "SQL statements issued.", "queries", "{}"),
+                    ("trivia_db_query_duration_seconds_total", "counter", "Time spent in the database.",
+                     "db_seconds", "{:.6f}"),
+                    ("trivia_db_rows_total", "counter", "Rows reported by the database driver.", "rows", "{}")):
+                lines += ["# HELP {} {}".format(name, help_text), "# TYPE {} {}".format(name, kind)]
+                for (endpoint, method), row in totals:
+                    lines.append("{}{} {}".format(name, _labels(endpoint=endpoint, method=method),
+                                                  template.format(getattr(row, attribute))))
+        return "\n".join(lines) + "\n"
+
+    def response(self):
+        return Response(self.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+    def init_app(self, app):
+        # registered before the other hooks, so a response served early by
+        # the response cache is still timed
+        app.before_request(self.start)
+        app.after_request(self.finish)
@@ -0,0 +1,92 @@
+"""
+Keyset paging
+
+Pages are read by seeking on an indexed, strictly increasing column
+(`WHERE id > :after_id ORDER BY id LIMIT n`) instead of OFFSET, so the cost
+of a page does not grow with its position in the table.
+"""
+import base64
+import json
+
+from sqlalchemy import func
+
+from models import db
+
+
+def encode_cursor(last_id):
+    """Turn the last id of a page into an opaque cursor string."""
+    if last_id is None:
+        return None
+    raw = json.dumps({"after_id": last_id}).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor. Raises ValueError on a malformed cursor."""
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        after_id = payload["after_id"]
+    except (TypeError, KeyError, ValueError) as e:
+        raise ValueError("invalid cursor") from e
+    if not isinstance(after_id, int):
+        raise ValueError("invalid cursor")
+    return after_id
+
+
+def anchor_for_page(query, column, page, per_page):
+    """
+    Return the id a legacy `?page=` request should seek after.
+
+    Only the indexed key column is read, so locating the anchor is an
+    index-only lookup rather than a scan of full rows.
+    """
+    if page <= 1:
+        return None
+    return query.with_entities(column).order_by(column).offset(
+        (page - 1) * per_page - 1).limit(1).scalar()
+
+
+def seek(query, column, after_id, per_page):
+    """
+    Fetch one page of `query` ordered by `column`, starting after `after_id`.
+
+    Returns (items, next_cursor). One extra row is fetched to know whether a
+    following page exists without a second query.
+    """
+    if after_id is not None:
+        query = query.filter(column > after_id)
+    rows = query.order_by(column).limit(per_page + 1).all()
+    items = rows[:per_page]
+    next_cursor = None
+    if len(rows) > per_page:
+        next_cursor = encode_cursor(getattr(items[-1], column.key))
+    return items, next_cursor
+
+
+def page_from_request(args, query, column, per_page):
+    """
+    Resolve `?cursor=`, `?after_id=` or the legacy `?page=` into a page.
+
+    Returns (items, next_cursor). Raises ValueError for malformed arguments
+    and LookupError when a legacy page lies beyond the last row.
+    """
+    cursor = args.get("cursor")
+    after_id = args.get("after_id")
+    if cursor:
+        return seek(query, column, decode_cursor(cursor), per_page)
+    if after_id is not None:
+        return seek(query, column, int(after_id), per_page)
+
+    page = int(args.get("page", 1))
+    if page < 1:
+        raise ValueError("page must be positive")
+    anchor = anchor_for_page(query, column, page, per_page)
+    if page > 1 and anchor is None:
+        raise LookupError("page out of range")
+    return seek(query, column, anchor, per_page)
+
+
+def count(column):
+    """SQL-side COUNT over `column`; no rows are loaded into the ORM."""
+    return db.session.query(func.count(column)).scalar()
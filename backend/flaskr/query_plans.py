@@ -0,0 +1,129 @@
+"""
+Query plan check
+
+EXPLAINs the statements the routes issue against `questions` and its
+change log, and reports any that would read the whole table or sort it
+instead of walking an index. Run it after a migration or a handler change:
+
+    flask check-query-plans
+
+On PostgreSQL sequential scans are disabled for the EXPLAIN, so the planner
+shows whether an index *can* serve the query even on a table small enough
+that it would normally scan it.
+"""
+import click
+
+from models import db, Job, Question, QuestionChange
+from .quiz import index_query
+from .serialization import question_query
+
+SAMPLE_ID = 1
+SAMPLE_CATEGORY = 1
+PAGE = 11  # QUESTIONS_PER_PAGE + 1, see paging.seek
+
+# (route, statement, walks_key): walks_key marks id-ordered reads with a
+# LIMIT, which SQLite serves by walking the table's own primary key b-tree
+ROUTE_QUERIES = (
+    ("GET /questions", "first page",
+     lambda: question_query().order_by(Question.id).limit(PAGE), True),
+    ("GET /questions", "page after a cursor",
+     lambda: question_query().filter(Question.id > SAMPLE_ID).order_by(Question.id).limit(PAGE), False),
+    ("GET /questions?page=", "page anchor",
+     lambda: db.session.query(Question.id).order_by(Question.id).offset(20).limit(1), True),
+    ("GET /questions", "total",
+     lambda: db.session.query(db.func.count(Question.id)), False),
+    ("GET /categories/<id>/questions", "first page",
+     lambda: question_query().filter(Question.category == SAMPLE_CATEGORY).order_by(Question.id).limit(PAGE),
+     False),
+    ("GET /categories/<id>/questions", "page after a cursor",
+     lambda: question_query().filter(Question.category == SAMPLE_CATEGORY, Question.id > SAMPLE_ID)
+     .order_by(Question.id).limit(PAGE), False),
+    ("GET /categories/<id>/questions?page=", "page anchor",
+     lambda: db.session.query(Question.id).filter(Question.category == SAMPLE_CATEGORY)
+     .order_by(Question.id).offset(20).limit(1), False),
+    ("POST /quizzes", "question index load", index_query, False),
+    ("POST /quizzes", "question by id",
+     lambda: question_query().filter(Question.id == SAMPLE_ID), False),
+    ("DELETE /questions", "questions by ids",
+     lambda: question_query().filter(Question.id.in_([SAMPLE_ID, SAMPLE_ID + 1])), False),
+    ("GET /questions/changes", "changes after a version",
+     lambda: QuestionChange.query.filter(QuestionChange.version > SAMPLE_ID)
+     .order_by(QuestionChange.version).limit(PAGE), False),
+    ("GET /questions", "latest change",
+     lambda: db.session.query(QuestionChange.version, QuestionChange.changed_at)
+     .order_by(QuestionChange.version.desc()).limit(1), True),
+    ("GET /jobs/<id>", "job by id",
+     lambda: Job.query.filter(Job.id == SAMPLE_ID), False),
+)
+
+
+def _compile(query, dialect):
+    compiled = query.statement.compile(dialect=dialect)
+    if compiled.positional:
+        return str(compiled), tuple(compiled.params[name] for name in compiled.positiontup)
+    return str(compiled), compiled.params
+
+
+def _postgres_plan(connection, sql, params):
+    def walk(node, depth=0):
+        line = "  " * depth + node["Node Type"]
+        if "Relation Name" in node:
+            line += " on " + node["Relation Name"]
+        if "Index Name" in node:
+            line += " using " + node["Index Name"]
+        lines = [line]
+        for child in node.get("Plans", ()):
+            lines += walk(child, depth + 1)
+        return lines
+
+    with connection.begin() as transaction:
+        connection.execute("SET LOCAL enable_seqscan = off")
+        plan = connection.execute("EXPLAIN (FORMAT JSON) " + sql, params).scalar()
+        transaction.rollback()
+    return walk(plan[0]["Plan"])
+
+
+def explain(query):
+    """The plan of an ORM query, one line per step."""
+    engine = db.engine
+    sql, params = _compile(query, engine.dialect)
+    with engine.connect() as connection:
+        if engine.dialect.name == "postgresql":
+            return _postgres_plan(connection, sql, params)
+        if engine.dialect.name == "sqlite":
+            return [row[-1] for row in connection.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        raise NotImplementedError("no plan check for {}".format(engine.dialect.name))
+
+
+def problems(plan, walks_key=False):
+    """Steps of `plan` that scan or sort a table instead of using an index."""
+    found = []
+    for line in plan:
+        step = line.strip()
+        if step.startswith(("Seq Scan", "Sort")) or "TEMP B-TREE" in step:
+            found.append(step)
+        elif step.startswith("SCAN") and " USING " not in step and not walks_key:
+            found.append(step)
+    return found
+
+
+def check():
+    """Returns (route, statement, plan, problems) for every route query."""
+    results = []
+    for route, statement, build, walks_key in ROUTE_QUERIES:
+        plan = explain(build())
+        results.append((route, statement, plan, problems(plan, walks_key)))
+    return results
+
+
+def register_commands(app):
+
+    @app.cli.command("check-query-plans")
+    def check_query_plans():
+        """Verify that every route query is served by an index."""
+        failed = False
+        for route, statement, plan, found in check():
+            failed = failed or bool(found)
+            click.echo("{} {} - {}: {}".format("FAIL" if found else "ok  ", route, statement, " / ".join(plan)))
+        if failed:
+            raise SystemExit(1)
@@ -0,0 +1,587 @@
+"""
+Quiz selection
+
+Drawing a quiz question used to load every candidate row just to pick one.
+QuestionIndex keeps only the question ids, grouped by category and by
+(category, difficulty), and samples an unseen id from them in memory; the
+question itself comes from QuestionCache, so a warm draw sends no query. A
+quiz can target one difficulty, or adapt: each correct answer moves it one
+level up, each wrong one a level down.
+
+Quiz sessions don't shuffle their own copy of the ids: SharedDecks keeps one
+shuffled deck per category and difficulty, patched in place of a reshuffle
+when a question is written, and each session deals through it from its own
+random offset. Starting a session costs no more than a few integers, however
+many players start the same category at once.
+"""
+import random
+import secrets
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from models import db, Question
+from .serialization import format_rows, question_query
+
+ALL_CATEGORIES = 0
+DIFFICULTIES = range(1, 6)
+# level an adaptive quiz starts at
+START_DIFFICULTY = 1
+
+# rejection sampling is O(1) while the seen set is a small part of the pool;
+# after this many misses we fall back to filtering the pool once
+MAX_SAMPLE_ATTEMPTS = 8
+# deck builds raced by a write before SharedDecks builds under its lock
+DECK_BUILD_ATTEMPTS = 3
+
+
+class IdPool:
+    """A set of ids supporting O(1) add, remove and uniform random choice."""
+
+    def __init__(self):
+        self.ids = []
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, question_id):
+        return question_id in self.positions
+
+    def add(self, question_id):
+        if question_id in self.positions:
+            return
+        self.positions[question_id] = len(self.ids)
+        self.ids.append(question_id)
+
+    def remove(self, question_id):
+        position = self.positions.pop(question_id, None)
+        if position is None:
+            return
+        last = self.ids.pop()
+        if last != question_id:
+            self.ids[position] = last
+            self.positions[last] = position
+
+    def sample(self, exclude, rng):
+        """Return a random id not in `exclude`, or None when none is left."""
+        if not self.ids:
+            return None
+        for _ in range(MAX_SAMPLE_ATTEMPTS):
+            question_id = self.ids[rng.randrange(len(self.ids))]
+            if question_id not in exclude:
+                return question_id
+        remaining = [question_id for question_id in self.ids if question_id not in exclude]
+        if not remaining:
+            return None
+        return rng.choice(remaining)
+
+
+def next_difficulty(level, correct):
+    """The level after an answer: one up when correct, one down otherwise."""
+    if correct:
+        return min(level + 1, DIFFICULTIES[-1])
+    return max(level - 1, DIFFICULTIES[0])
+
+
+def nearest_difficulties(level):
+    """All levels, closest to `level` first, easier before harder on a tie."""
+    return sorted(DIFFICULTIES, key=lambda difficulty: (abs(difficulty - level), difficulty))
+
+
+def _key(category_id, difficulty):
+    return category_id if difficulty is None else (category_id, difficulty)
+
+
+def index_query():
+    """The rows QuestionIndex is loaded from, every question's id, category and difficulty."""
+    return db.session.query(Question.id, Question.category, Question.difficulty)
+
+
+class QuestionIndex:
+    """
+    Pools of question ids keyed by category id, and by (category id,
+    difficulty) for the difficulty buckets; ALL_CATEGORIES holds every
+    question. Writes move single ids between pools.
+    """
+
+    def __init__(self, ttl=300, clock=time.monotonic, rng=None):
+        self.ttl = ttl
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._pools = None
+        self._placements = {}
+        self._loaded_at = 0.0
+        self._generation = 0
+
+    @staticmethod
+    def _place(pools, placements, question_id, category_id, difficulty):
+        for key in (ALL_CATEGORIES, category_id, (ALL_CATEGORIES, difficulty), (category_id, difficulty)):
+            pools.setdefault(key, IdPool()).add(question_id)
+        placements[question_id] = (category_id, difficulty)
+
+    def load(self, rows):
+        """Replace the index with (question_id, category_id, difficulty) rows."""
+        pools = {ALL_CATEGORIES: IdPool()}
+        placements = {}
+        for question_id, category_id, difficulty in rows:
+            self._place(pools, placements, question_id, category_id, difficulty)
+        with self._lock:
+            self._pools = pools
+            self._placements = placements
+            self._loaded_at = self.clock()
+            self._generation += 1
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._pools is not None and self.clock() - self._loaded_at < self.ttl:
+                return self._pools
+        self.load(index_query().all())
+        return self._pools
+
+    def add(self, question_id, category_id, difficulty):
+        with self._lock:
+            if self._pools is None:
+                return
+            self._discard(question_id)
+            self._place(self._pools, self._placements, question_id, category_id, difficulty)
+
+    def discard(self, question_id):
+        with self._lock:
+            self._discard(question_id)
+
+    def _discard(self, question_id):
+        if self._pools is None:
+            return
+        placement = self._placements.pop(question_id, None)
+        self._pools[ALL_CATEGORIES].remove(question_id)
+        if placement is None:
+            return
+        category_id, difficulty = placement
+        for key in (category_id, (ALL_CATEGORIES, difficulty), (category_id, difficulty)):
+            if key in self._pools:
+                self._pools[key].remove(question_id)
+
+    def invalidate(self):
+        with self._lock:
+            self._pools = None
+            self._placements = {}
+
+    def generation(self):
+        """Bumped every time the index is loaded from the database."""
+        self._ensure_loaded()
+        with self._lock:
+            return self._generation
+
+    def ids(self, category_id=ALL_CATEGORIES, difficulty=None):
+        """
+        Return a copy of the question ids of a category, or of one of its
+        difficulty buckets, or None if the category is unknown.
+        """
+        pools = self._ensure_loaded()
+        with self._lock:
+            if category_id not in pools:
+                return None
+            pool = pools.get(_key(category_id, difficulty))
+            return list(pool.ids) if pool is not None else []
+
+    def size(self, category_id=ALL_CATEGORIES, difficulty=None):
+        pools = self._ensure_loaded()
+        with self._lock:
+            pool = pools.get(_key(category_id, difficulty))
+            return len(pool) if pool is not None else 0
+
+    def draw(self, category_id=ALL_CATEGORIES, exclude=(), difficulty=None):
+        """
+        Return a random question id of the category, of `difficulty` if
+        given, that is not in `exclude`; or None.
+        """
+        pools = self._ensure_loaded()
+        exclude = exclude if isinstance(exclude, (set, frozenset)) else set(exclude)
+        with self._lock:
+            pool = pools.get(_key(category_id, difficulty))
+            if pool is None:
+                return None
+            return pool.sample(exclude, self.rng)
+
+    def draw_nearest(self, category_id=ALL_CATEGORIES, exclude=(), difficulty=START_DIFFICULTY):
+        """Like draw(), falling back to the closest difficulty with questions left."""
+        exclude = exclude if isinstance(exclude, (set, frozenset)) else set(exclude)
+        for level in nearest_difficulties(difficulty):
+            question_id = self.draw(category_id, exclude, level)
+            if question_id is not None:
+                return question_id
+        return None
+
+    def on_write(self, table, action, record):
+        """Write listener, see models.subscribe."""
+        if table != Question.__tablename__:
+            return
+        if action == 'reload':
+            self.invalidate()
+        elif action == 'delete':
+            self.discard(record['id'])
+        else:
+            self.add(record['id'], record['category'], record['difficulty'])
+
+
+class QuestionCache:
+    """
+    Question records by id, the shape of Question.format(). A miss loads the
+    row by primary key; writes made by this process update the cache, and
+    entries are reloaded after `ttl` seconds to pick up other workers'.
+    """
+
+    def __init__(self, ttl=300, max_entries=50000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._records = OrderedDict()
+
+    def __len__(self):
+        return len(self._records)
+
+    def _store(self, record):
+        self._records[record['id']] = (record, self.clock())
+        self._records.move_to_end(record['id'])
+        while len(self._records) > self.max_entries:
+            self._records.popitem(last=False)
+
+    def get(self, question_id):
+        """The record of a question, or None if it does not exist."""
+        with self._lock:
+            entry = self._records.get(question_id)
+            if entry is not None and self.clock() - entry[1] < self.ttl:
+                self._records.move_to_end(question_id)
+                return entry[0]
+        rows = question_query().filter(Question.id == question_id).all()
+        with self._lock:
+            if not rows:
+                self._records.pop(question_id, None)
+                return None
+            record = format_rows(rows)[0]
+            self._store(record)
+            return record
+
+    def on_write(self, table, action, record):
+        """Write listener, see models.subscribe."""
+        if table != Question.__tablename__:
+            return
+        with self._lock:
+            if action == 'reload':
+                self._records.clear()
+            elif action == 'delete':
+                self._records.pop(record['id'], None)
+            else:
+                self._store(dict(record))
+
+
+def draw_question(index, questions, category_id=ALL_CATEGORIES, previous_questions=(), difficulty=None,
+                  nearest=False):
+    """
+    Return the record of a random unseen question, or None when the pool is
+    exhausted.
+
+    With `difficulty` only questions of that difficulty are drawn, or, with
+    `nearest`, of the closest difficulty that has unseen questions left.
+    Ids the index still knows about but that are gone from the database
+    (deleted by another worker) are dropped and the draw is retried.
+    """
+    seen = set(previous_questions)
+    while True:
+        if nearest:
+            question_id = index.draw_nearest(category_id, seen, difficulty)
+        else:
+            question_id = index.draw(category_id, seen, difficulty)
+        if question_id is None:
+            return None
+        question = questions.get(question_id)
+        if question is not None:
+            return question
+        index.discard(question_id)
+
+
+def _shuffled(question_ids, rng):
+    deck = array("I", question_ids)
+    for i in range(len(deck) - 1, 0, -1):
+        j = rng.randrange(i + 1)
+        deck[i], deck[j] = deck[j], deck[i]
+    return deck
+
+
+def _deck_keys(category_id, difficulty):
+    return {ALL_CATEGORIES, category_id, (ALL_CATEGORIES, difficulty), (category_id, difficulty)}
+
+
+class SharedDecks:
+    """
+    One shuffled deck of question ids per category, and per (category,
+    difficulty), built on first use and shared by every session.
+
+    Decks are compact unsigned-int arrays and never change once handed out:
+    the first write after get() returned a deck replaces it with a copy, and
+    later writes patch that copy in place until it is handed out again, so a
+    batch of writes copies each deck at most once. A new id is appended and
+    swapped with a random position, a removed one is overwritten by the last
+    id, which keeps the decks uniformly shuffled without reshuffling; a map
+    of id -> position per deck finds them in O(1). Sessions holding an old
+    copy carry on with it. All decks are rebuilt after the index reloads.
+    """
+
+    def __init__(self, index, rng=None):
+        self.index = index
+        self.rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._decks = {}
+        self._positions = {}
+        self._shared = set()
+        self._generation = None
+        # question writes seen, so a deck built meanwhile is not installed
+        self._writes = 0
+
+    def _clear(self):
+        self._decks = {}
+        self._positions = {}
+        self._shared = set()
+
+    def _build(self, category_id, difficulty):
+        question_ids = self.index.ids(category_id, difficulty)
+        if question_ids is None:
+            return None, None
+        deck = _shuffled(question_ids, self.rng)
+        return deck, {question_id: position for position, question_id in enumerate(deck)}
+
+    def _cached(self, key, generation):
+        if self._generation != generation:
+            self._clear()
+            self._generation = generation
+        deck = self._decks.get(key)
+        if deck is not None:
+            self._shared.add(key)
+        return deck
+
+    def _install(self, key, deck, positions):
+        self._decks[key] = deck
+        self._positions[key] = positions
+        self._shared.add(key)
+        return deck
+
+    def get(self, category_id=ALL_CATEGORIES, difficulty=None):
+        """The deck of a category or difficulty bucket, or None if the category is unknown."""
+        key = _key(category_id, difficulty)
+        for _ in range(DECK_BUILD_ATTEMPTS):
+            generation = self.index.generation()
+            with self._lock:
+                deck = self._cached(key, generation)
+                if deck is not None:
+                    return deck
+                writes = self._writes
+            # built without the lock; a write meanwhile could not patch it,
+            # so it is only installed if none happened
+            deck, positions = self._build(category_id, difficulty)
+            if deck is None:
+                return None
+            with self._lock:
+                if self._generation == generation and self._writes == writes:
+                    return self._install(key, deck, positions)
+        # writes keep coming: build once more, holding them off meanwhile
+        generation = self.index.generation()
+        with self._lock:
+            deck = self._cached(key, generation)
+            if deck is not None:
+                return deck
+            deck, positions = self._build(category_id, difficulty)
+            return self._install(key, deck, positions) if deck is not None else None
+
+    def _writable(self, key):
+        deck = self._decks[key]
+        if key in self._shared:
+            deck = self._decks[key] = deck[:]
+            self._shared.discard(key)
+        return deck
+
+    def _patch(self, question_id, keys):
+        for key, positions in self._positions.items():
+            present = question_id in positions
+            if key in keys and not present:
+                deck = self._writable(key)
+                deck.append(question_id)
+                position = self.rng.randrange(len(deck))
+                moved = deck[position]
+                deck[position], deck[-1] = question_id, moved
+                positions[moved] = len(deck) - 1
+                positions[question_id] = position
+            elif present and key not in keys:
+                deck = self._writable(key)
+                position = positions.pop(question_id)
+                last = deck.pop()
+                if last != question_id:
+                    deck[position] = last
+                    positions[last] = position
+
+    def on_write(self, table, action, record):
+        """Write listener, see models.subscribe."""
+        if table != Question.__tablename__:
+            return
+        with self._lock:
+            self._writes += 1
+            if action == 'reload':
+                self._clear()
+            elif action == 'delete':
+                self._patch(record['id'], ())
+            else:
+                self._patch(record['id'], _deck_keys(record['category'], record['difficulty']))
+
+
+class QuizSession:
+    """
+    A quiz in progress: for each difficulty it deals from, a shared deck and
+    a random offset into it. The seen set is implicit (every id from the
+    offset on, up to the number dealt), so nothing grows with the number of
+    rounds played or is copied per player.
+
+    A plain session has one deck (of one difficulty when targeted); an
+    adaptive one has a deck per difficulty and deals from the deck of its
+    current level, or the nearest one with questions left.
+    """
+    __slots__ = ("id", "category_id", "decks", "offsets", "dealt", "difficulty", "adaptive", "played",
+                 "last_used")
+
+    def __init__(self, session_id, category_id, decks, rng, now, difficulty=None, adaptive=False):
+        self.id = session_id
+        self.category_id = category_id
+        self.decks = decks
+        self.offsets = {level: rng.randrange(len(deck)) if deck else 0 for level, deck in decks.items()}
+        self.dealt = dict.fromkeys(decks, 0)
+        self.difficulty = difficulty
+        self.adaptive = adaptive
+        self.played = 0
+        self.last_used = now
+
+    def deal(self, correct=None):
+        if self.adaptive:
+            if correct is not None and self.played:
+                self.difficulty = next_difficulty(self.difficulty, correct)
+            levels = nearest_difficulties(self.difficulty)
+        else:
+            levels = (self.difficulty,)
+        for level in levels:
+            deck = self.decks.get(level)
+            if deck is None:
+                continue
+            dealt = self.dealt[level]
+            if dealt < len(deck):
+                self.dealt[level] = dealt + 1
+                self.played += 1
+                return deck[(self.offsets[level] + dealt) % len(deck)]
+        return None
+
+    def format(self):
+        return {
+            "id": self.id,
+            "category": self.category_id,
+            "difficulty": self.difficulty,
+            "adaptive": self.adaptive,
+            "played": self.played,
+            "remaining": sum(len(deck) - self.dealt[level] for level, deck in self.decks.items()),
+        }
+
+
+class QuizSessionStore:
+    """
+    In-process quiz sessions with idle eviction.
+
+    Sessions unused for `idle_timeout` seconds are dropped, and at most
+    `max_sessions` are kept (least recently used first out).
+    """
+
+    def __init__(self, index, idle_timeout=1800, max_sessions=10000, clock=time.monotonic, rng=None,
+                 decks=None):
+        self.index = index
+        self.decks = decks if decks is not None else SharedDecks(index)
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _evict(self, now):
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_used < self.idle_timeout and len(self._sessions) <= self.max_sessions:
+                break
+            self._sessions.popitem(last=False)
+
+    def create(self, category_id=ALL_CATEGORIES, difficulty=None, adaptive=False):
+        """
+        Start a session, or return None when the category is unknown. An
+        adaptive session starts at `difficulty`, default START_DIFFICULTY.
+        """
+        if adaptive:
+            difficulty = START_DIFFICULTY if difficulty is None else difficulty
+            levels = DIFFICULTIES
+        else:
+            levels = (difficulty,)
+        decks = {}
+        for level in levels:
+            decks[level] = self.decks.get(category_id, level)
+            if decks[level] is None:
+                return None
+        now = self.clock()
+        session = QuizSession(secrets.token_urlsafe(16), category_id, decks, self.rng, now,
+                              difficulty=difficulty, adaptive=adaptive)
+        with self._lock:
+            self._sessions[session.id] = session
+            self._evict(now)
+        return session
+
+    def get(self, session_id):
+        now = self.clock()
+        with self._lock:
+            self._evict(now)
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = now
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def deal(self, session_id, correct=None):
+        """
+        Return the next question id of a session, or None when it has none
+        left. `correct` says how the previous question was answered, which
+        moves the level of an adaptive session.
+        """
+        session = self.get(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        with self._lock:
+            return session.deal(correct)
+
+    def finish(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None)
+
+
+def deal_question(sessions, questions, session_id, correct=None):
+    """
+    Return the record of the next question of a session, or None when it is
+    over.
+
+    Questions deleted since the deck was dealt are skipped.
+    """
+    while True:
+        question_id = sessions.deal(session_id, correct)
+        if question_id is None:
+            return None
+        question = questions.get(question_id)
+        if question is not None:
+            return question
+        # the answer was already applied to the level
+        correct = None
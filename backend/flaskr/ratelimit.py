@@ -0,0 +1,50 @@
+"""
+Per-client rate limiting
+
+A token bucket per client: each holds up to `burst` tokens, refilled at
+`rate` tokens a second, and every request takes one. A client typing fast
+gets through its burst at once and is then held to the steady rate; a
+request finding the bucket empty is answered 429 with a Retry-After header.
+
+Clients are told apart by request.remote_addr. Behind a reverse proxy wrap
+the app in werkzeug's ProxyFix so that is the client's address and not the
+proxy's. Buckets are per process and only the `max_clients` most recently
+seen clients are remembered.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenBucketLimiter:
+
+    def __init__(self, rate=5.0, burst=20, max_clients=10000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+        self.stats = {"allowed": 0, "limited": 0}
+
+    def acquire(self, client):
+        """
+        Take a token for `client`. Returns 0 when the request may proceed,
+        otherwise the whole seconds until a token is available.
+        """
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+                self.stats["allowed"] += 1
+            else:
+                wait = max(1, int(math.ceil((1 - tokens) / self.rate)))
+                self.stats["limited"] += 1
+            self._buckets[client] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return wait
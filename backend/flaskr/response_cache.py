@@ -0,0 +1,158 @@
+"""
+Response cache
+
+Successful responses of the read endpoints are cached keyed by path and
+query arguments. Every key also carries a data version that is bumped after
+any committed question or category write, so a write makes all previously
+cached responses unreachable at once instead of deleting them one by one.
+
+The storage is pluggable: anything implementing CacheBackend works. The
+default MemoryBackend is a per-process LRU; a backend shared between
+processes (Redis or a local stand-in) also shares the version counter, so
+a write in one worker invalidates the cache of all of them.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, g, request
+
+
+class CacheBackend:
+    """
+    Storage interface of the response cache.
+
+    Values are plain tuples of str, int and bytes, so backends living
+    outside the process only need to serialize them.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def incr(self, key):
+        """Atomically add one to an integer (missing counts as 0) and return it."""
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+
+    def __init__(self, max_entries=1024, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and self.clock() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = self.clock() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def incr(self, key):
+        with self._lock:
+            value = (self._entries.get(key, (0, None))[0] or 0) + 1
+            self._entries[key] = (value, None)
+            return value
+
+
+# response headers worth replaying from the cache; CORS and the like are
+# added again by the after_request hooks on every response
+CACHED_HEADERS = ("Content-Type", "ETag", "Content-Encoding", "Vary", "Last-Modified", "Cache-Control")
+
+
+class ResponseCache:
+
+    def __init__(self, backend=None, ttl=60, endpoints=(), namespace="trivia", variant=None):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self.endpoints = set(endpoints)
+        # variant(request) tells apart representations of one URL, such as
+        # the content encoding
+        self.variant = variant
+        self.namespace = namespace
+        self.version_key = "{}:version".format(namespace)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def version(self):
+        return self.backend.get(self.version_key) or 0
+
+    def invalidate(self):
+        self.backend.incr(self.version_key)
+        self._count("invalidations")
+
+    def key(self, req):
+        args = "&".join("{}={}".format(name, value) for name, value in sorted(req.args.items(multi=True)))
+        key = "{}:v{}:{}?{}".format(self.namespace, self.version(), req.path, args)
+        if self.variant is not None:
+            key = "{}#{}".format(key, self.variant(req) or "")
+        return key
+
+    def cacheable(self, req):
+        return req.method == "GET" and req.endpoint in self.endpoints
+
+    def lookup(self):
+        """before_request hook: answer from the cache when possible."""
+        if not self.cacheable(request):
+            return None
+        g.response_cache_key = self.key(request)
+        cached = self.backend.get(g.response_cache_key)
+        if cached is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        status, headers, body = cached
+        headers = dict(headers)
+        etag = headers.get("ETag")
+        if etag and request.if_none_match.contains(etag.strip('"')):
+            response = Response(status=304)
+            response.headers["ETag"] = etag
+        else:
+            response = Response(body, status=status, headers=headers)
+        response.headers["X-Cache"] = "HIT"
+        return response
+
+    def store(self, response):
+        """after_request hook: keep successful responses of cacheable endpoints."""
+        key = g.pop("response_cache_key", None)
+        if key is None or "X-Cache" in response.headers:
+            return response
+        response.headers["X-Cache"] = "MISS"
+        if response.status_code != 200 or response.direct_passthrough:
+            return response
+        headers = tuple((name, response.headers[name]) for name in CACHED_HEADERS if name in response.headers)
+        self.backend.set(key, (response.status_code, headers, response.get_data()), ttl=self.ttl)
+        self._count("stores")
+        return response
+
+    def on_write(self, table, action, record):
+        """Write listener, see models.subscribe."""
+        self.invalidate()
+
+    def init_app(self, app):
+        app.before_request(self.lookup)
+        app.after_request(self.store)
@@ -0,0 +1,281 @@
+"""
+Question search
+
+On PostgreSQL the search runs against the GIN index on
+to_tsvector('english', question) declared in models.py, ranked with ts_rank.
+Other databases (SQLite in tests and benchmarks) use an in-process inverted
+index kept in sync through the write listeners.
+
+Every word of the search term must match; the last one also matches as a
+prefix so results keep up with search-as-you-type.
+
+Either backend is wrapped in a CoalescingSearch: identical searches running
+at the same time share one execution, and results are kept for a few
+seconds so the next keystrokes of many users typing the same term are
+served without touching the database.
+"""
+import bisect
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from sqlalchemy import func, literal_column
+
+from models import db, Question, SEARCH_CONFIG
+from .serialization import question_query
+
+WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    return WORD.findall((text or "").lower())
+
+
+class PostgresSearch:
+
+    def _match(self, words):
+        # the configuration is inlined so the expression matches the index
+        config = literal_column("'{}'::regconfig".format(SEARCH_CONFIG))
+        terms = [word + ":*" if i == len(words) - 1 else word for i, word in enumerate(words)]
+        query = func.to_tsquery(config, " & ".join(terms))
+        vector = func.to_tsvector(config, Question.question)
+        return vector.op("@@")(query), func.ts_rank(vector, query)
+
+    def search(self, term, page, per_page):
+        """Return (question rows of the page, total number of matches)."""
+        words = tokenize(term)
+        if not words:
+            return [], 0
+        condition, rank = self._match(words)
+        total = db.session.query(func.count(Question.id)).filter(condition).scalar()
+        questions = question_query().filter(condition).order_by(
+            rank.desc(), Question.id).offset((page - 1) * per_page).limit(per_page).all()
+        return questions, total
+
+    def warm(self):
+        pass
+
+    def on_write(self, table, action, record):
+        pass
+
+
+class InvertedIndex:
+
+    def __init__(self, ttl=300, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._postings = None
+        self._vocabulary = []
+        self._documents = {}
+        self._loaded_at = 0.0
+
+    def load(self, rows):
+        """Replace the index with (question_id, question_text) rows."""
+        postings = {}
+        documents = {}
+        for question_id, text in rows:
+            counts = Counter(tokenize(text))
+            documents[question_id] = counts
+            for word, count in counts.items():
+                postings.setdefault(word, {})[question_id] = count
+        with self._lock:
+            self._postings = postings
+            self._vocabulary = sorted(postings)
+            self._documents = documents
+            self._loaded_at = self.clock()
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._postings is not None and self.clock() - self._loaded_at < self.ttl:
+                return
+        self.load(db.session.query(Question.id, Question.question).all())
+
+    def warm(self):
+        """Load the index now instead of on the first search."""
+        self._ensure_loaded()
+
+    def _add(self, question_id, text):
+        self._remove(question_id)
+        counts = Counter(tokenize(text))
+        self._documents[question_id] = counts
+        for word, count in counts.items():
+            if word not in self._postings:
+                bisect.insort(self._vocabulary, word)
+                self._postings[word] = {}
+            self._postings[word][question_id] = count
+
+    def _remove(self, question_id):
+        for word in self._documents.pop(question_id, ()):
+            postings = self._postings.get(word)
+            if postings is None:
+                continue
+            postings.pop(question_id, None)
+            if not postings:
+                del self._postings[word]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, word)]
+
+    def _prefixed(self, prefix):
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        for word in self._vocabulary[start:]:
+            if not word.startswith(prefix):
+                break
+            yield word
+
+    def _scores(self, words):
+        scores = None
+        for i, word in enumerate(words):
+            matched = self._prefixed(word) if i == len(words) - 1 else (word,)
+            hits = Counter()
+            for candidate in matched:
+                hits.update(self._postings.get(candidate, {}))
+            if scores is None:
+                scores = hits
+            else:
+                scores = Counter({question_id: scores[question_id] + count
+                                  for question_id, count in hits.items() if question_id in scores})
+            if not scores:
+                break
+        return scores or Counter()
+
+    def ranked_ids(self, term):
+        words = tokenize(term)
+        if not words:
+            return []
+        self._ensure_loaded()
+        with self._lock:
+            scores = self._scores(words)
+        return sorted(scores, key=lambda question_id: (-scores[question_id], question_id))
+
+    def search(self, term, page, per_page):
+        """Return (question rows of the page, total number of matches)."""
+        ranked = self.ranked_ids(term)
+        page_ids = ranked[(page - 1) * per_page:page * per_page]
+        if not page_ids:
+            return [], len(ranked)
+        by_id = {question.id: question for question in question_query().filter(Question.id.in_(page_ids))}
+        return [by_id[question_id] for question_id in page_ids if question_id in by_id], len(ranked)
+
+    def on_write(self, table, action, record):
+        """Write listener, see models.subscribe."""
+        if table != Question.__tablename__:
+            return
+        with self._lock:
+            if self._postings is None:
+                return
+            if action == 'reload':
+                self._postings = None
+            elif action == 'delete':
+                self._remove(record['id'])
+            else:
+                self._add(record['id'], record['question'])
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class CoalescingSearch:
+    """
+    Single-flight and short-lived result cache in front of a search backend.
+
+    Searches are keyed by their words, so "World " and "world" are the same
+    search. The first request for a key runs it; requests for the same key
+    arriving meanwhile wait for that result instead of running it again.
+    Results are kept for `ttl` seconds and dropped on any question write;
+    a search that was running while a question was written is not cached.
+    """
+
+    def __init__(self, backend, ttl=5, max_entries=1024, clock=time.monotonic):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._results = OrderedDict()
+        self._flights = {}
+        self._generation = 0
+        self.stats = {"executed": 0, "coalesced": 0, "cache_hits": 0}
+
+    def _cached(self, key):
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        result, expires_at = entry
+        if self.clock() >= expires_at:
+            del self._results[key]
+            return None
+        self._results.move_to_end(key)
+        return result
+
+    def search(self, term, page, per_page):
+        """Return (question rows of the page, total number of matches)."""
+        words = tokenize(term)
+        if not words:
+            return [], 0
+        key = (" ".join(words), page, per_page)
+        with self._lock:
+            result = self._cached(key)
+            if result is not None:
+                self.stats["cache_hits"] += 1
+                return result
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                generation = self._generation
+                self.stats["executed"] += 1
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            rows, total = self.backend.search(term, page, per_page)
+            # plain tuples, safe to hand to other requests
+            flight.result = ([tuple(row) for row in rows], total)
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                if flight.error is None and self.ttl and generation == self._generation:
+                    self._results[key] = (flight.result, self.clock() + self.ttl)
+                    while len(self._results) > self.max_entries:
+                        self._results.popitem(last=False)
+            flight.done.set()
+        return flight.result
+
+    def warm(self):
+        self.backend.warm()
+
+    def on_write(self, table, action, record):
+        """Write listener, see models.subscribe."""
+        self.backend.on_write(table, action, record)
+        if table != Question.__tablename__:
+            return
+        with self._lock:
+            self._generation += 1
+            self._results.clear()
+
+
+def create_search(app, backend="auto", ttl=300, result_ttl=5, max_results=1024):
+    """Pick the search backend for the app's database, behind a CoalescingSearch."""
+    if backend == "auto":
+        with app.app_context():
+            backend = db.engine.dialect.name
+    if backend == "postgresql":
+        engine = PostgresSearch()
+    else:
+        engine = InvertedIndex(ttl=ttl)
+    return CoalescingSearch(engine, ttl=result_ttl, max_entries=max_results)
@@ -0,0 +1,68 @@
+"""
+Lean serialization
+
+List endpoints select only the question columns as plain tuples and turn
+them into dicts directly, skipping ORM instances and Question.format().
+
+FastJSONEncoder is installed as the app's json_encoder, so every jsonify
+call goes through orjson when it is installed (`pip install orjson`) and
+falls back to the standard library otherwise.
+"""
+from flask.json import JSONEncoder
+
+from models import db, Question
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+QUESTION_FIELDS = ('id', 'question', 'answer', 'category', 'difficulty')
+
+
+def parse_fields(value):
+    """
+    Turn a `?fields=question,answer` argument into the fields to select.
+
+    The id is always included since paging seeks on it. Returns every field
+    when `value` is empty; raises ValueError on an unknown field.
+    """
+    if not value:
+        return QUESTION_FIELDS
+    requested = set(field.strip() for field in value.split(",") if field.strip())
+    unknown = requested - set(QUESTION_FIELDS)
+    if unknown:
+        raise ValueError("unknown fields: {}".format(", ".join(sorted(unknown))))
+    return tuple(field for field in QUESTION_FIELDS if field == 'id' or field in requested)
+
+
+def question_columns(fields=QUESTION_FIELDS):
+    return [getattr(Question, field) for field in fields]
+
+
+def question_query(fields=QUESTION_FIELDS):
+    """A query over the question columns only; rows come back as tuples."""
+    return db.session.query(*question_columns(fields))
+
+
+def format_rows(rows, fields=QUESTION_FIELDS):
+    """Same shape as Question.format(), built from projected rows."""
+    return [dict(zip(fields, row)) for row in rows]
+
+
+class FastJSONEncoder(JSONEncoder):
+
+    def encode(self, o):
+        # orjson only knows a 2-space indent; pretty-printed output keeps
+        # the standard encoder
+        if orjson is None or self.indent is not None:
+            return super().encode(o)
+        # dates are passed through to Flask's default() so they keep the
+        # same format with or without orjson
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(o, default=self.default, option=option).decode('utf-8')
+        except TypeError:
+            return super().encode(o)
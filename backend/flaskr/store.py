@@ -0,0 +1,163 @@
+"""
+In-memory question store
+
+An optional read-through copy of the questions table for the hot read
+paths: GET /questions, GET /categories/<id>/questions and the quiz draws.
+Each question is a QuestionRecord (__slots__, no per-instance dict); ids
+are kept sorted in compact unsigned-int arrays, one for the whole table and
+one per category, so a page is a bisect and a slice instead of a query.
+
+The store is loaded with one query on first use (not at startup, so the app
+still boots without touching the database), kept in sync by the write
+listeners, and reloaded after `ttl` seconds to pick up writes made by other
+processes. Paging takes the same ?cursor=, ?after_id= and ?page= arguments
+and returns the same cursors as flaskr.paging.
+
+    python -m benchmarks.question_store
+
+compares its memory use and page latency with the SQL paths.
+"""
+import bisect
+import threading
+import time
+from array import array
+
+from models import db, Question
+from .paging import decode_cursor, encode_cursor
+from .serialization import QUESTION_FIELDS, question_columns
+
+
+class QuestionRecord:
+    __slots__ = QUESTION_FIELDS
+
+    def __init__(self, id, question, answer, category, difficulty):
+        self.id = id
+        self.question = question
+        self.answer = answer
+        self.category = category
+        self.difficulty = difficulty
+
+    def row(self, fields=QUESTION_FIELDS):
+        return tuple(getattr(self, field) for field in fields)
+
+    def format(self):
+        return dict(zip(QUESTION_FIELDS, self.row()))
+
+
+def _insert(ids, question_id):
+    position = bisect.bisect_left(ids, question_id)
+    if position == len(ids) or ids[position] != question_id:
+        ids.insert(position, question_id)
+
+
+def _remove(ids, question_id):
+    position = bisect.bisect_left(ids, question_id)
+    if position < len(ids) and ids[position] == question_id:
+        del ids[position]
+
+
+class QuestionStore:
+
+    def __init__(self, ttl=300, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._records = None
+        self._ids = array("I")
+        self._by_category = {}
+        self._loaded_at = 0.0
+
+    def __len__(self):
+        return len(self._records or ())
+
+    def load(self, rows):
+        """Replace the store with rows of QUESTION_FIELDS, in id order."""
+        records = {}
+        ids = array("I")
+        by_category = {}
+        for row in rows:
+            record = QuestionRecord(*row)
+            records[record.id] = record
+            ids.append(record.id)
+            by_category.setdefault(record.category, array("I")).append(record.id)
+        with self._lock:
+            self._records = records
+            self._ids = ids
+            self._by_category = by_category
+            self._loaded_at = self.clock()
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._records is not None and self.clock() - self._loaded_at < self.ttl:
+                return
+        self.load(db.session.query(*question_columns()).order_by(Question.id).all())
+
+    def get(self, question_id):
+        """The record of a question as a dict, or None; same interface as quiz.QuestionCache."""
+        self._ensure_loaded()
+        with self._lock:
+            record = self._records.get(question_id)
+            return record.format() if record is not None else None
+
+    def count(self, category_id=None):
+        self._ensure_loaded()
+        with self._lock:
+            if category_id is None:
+                return len(self._ids)
+            return len(self._by_category.get(category_id, ()))
+
+    def page_from_request(self, args, fields=QUESTION_FIELDS, per_page=10, category_id=None):
+        """
+        Like paging.page_from_request: returns (rows, next_cursor) with rows
+        as tuples of `fields`. Raises ValueError for malformed arguments and
+        LookupError when a legacy page lies beyond the last question.
+        """
+        cursor = args.get("cursor")
+        after_id = args.get("after_id")
+        page = None
+        if cursor:
+            after_id = decode_cursor(cursor)
+        elif after_id is not None:
+            after_id = int(after_id)
+        else:
+            page = int(args.get("page", 1))
+            if page < 1:
+                raise ValueError("page must be positive")
+        self._ensure_loaded()
+        with self._lock:
+            ids = self._ids if category_id is None else self._by_category.get(category_id, array("I"))
+            if page is None:
+                start = bisect.bisect_right(ids, after_id)
+            else:
+                start = (page - 1) * per_page
+                if start > len(ids):
+                    raise LookupError("page out of range")
+            records = [self._records[question_id] for question_id in ids[start:start + per_page + 1]]
+        items = [record.row(fields) for record in records[:per_page]]
+        next_cursor = encode_cursor(records[per_page - 1].id) if len(records) > per_page else None
+        return items, next_cursor
+
+    def _discard(self, question_id):
+        record = self._records.pop(question_id, None)
+        if record is None:
+            return
+        _remove(self._ids, question_id)
+        category = self._by_category.get(record.category)
+        if category is not None:
+            _remove(category, question_id)
+
+    def on_write(self, table, action, record):
+        """Write listener, see models.subscribe."""
+        if table != Question.__tablename__:
+            return
+        with self._lock:
+            if self._records is None:
+                return
+            if action == 'reload':
+                self._records = None
+                return
+            self._discard(record['id'])
+            if action != 'delete':
+                self._records[record['id']] = QuestionRecord(*(record[field] for field in QUESTION_FIELDS))
+                _insert(self._ids, record['id'])
+                _insert(self._by_category.setdefault(record['category'], array("I")), record['id'])
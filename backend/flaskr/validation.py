@@ -0,0 +1,44 @@
+"""
+Question validation
+
+The rules POST /questions applies to a new question, shared with the bulk
+import so every write path accepts exactly the same rows.
+"""
+
+
+class InvalidQuestion(ValueError):
+    pass
+
+
+def validate_question(fields, category_exists):
+    """
+    Check the fields of a new question and return the cleaned values.
+
+    `category_exists` is called with the category id. Raises InvalidQuestion
+    with a readable message when a rule is broken.
+    """
+    question = fields.get("question", "")
+    answer = fields.get("answer", "")
+    difficulty = fields.get("difficulty", None)
+    category = fields.get("category", None)
+
+    if not isinstance(question, str) or not isinstance(answer, str) \
+            or question.strip() == "" or answer.strip() == "":
+        raise InvalidQuestion("question and answer should not be empty")
+
+    if not isinstance(difficulty, int):
+        raise InvalidQuestion("difficulty should be an integer")
+    if difficulty not in range(1, 6):
+        raise InvalidQuestion("difficulty should be an integer between 1 and 5")
+
+    if not isinstance(category, int):
+        raise InvalidQuestion("category should be an integer")
+    if not category_exists(category):
+        raise InvalidQuestion("category {} does not exist".format(category))
+
+    return {
+        "question": question,
+        "answer": answer,
+        "difficulty": difficulty,
+        "category": category,
+    }
@@ -0,0 +1,173 @@
+"""
+Schema migrations
+
+The schema is owned by the numbered migrations below rather than by
+db.create_all(). The version reached is kept in the schema_version table,
+so upgrade() only runs the steps a database has not seen yet. Every step
+runs in its own transaction together with its version bump, and on
+PostgreSQL under an advisory lock, so workers starting together cannot
+apply the same step twice. Steps only create what is missing, which lets a
+database restored from trivia.psql (tables, no version) be adopted as is.
+
+    flask db-upgrade            apply pending migrations
+    flask db-version            print the current and latest version
+
+New steps are appended to MIGRATIONS; released steps are never edited.
+"""
+import click
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, MetaData, String, Table, Text, inspect, text
+
+from models import SEARCH_INDEX_DDL, db
+
+VERSION_TABLE = 'schema_version'
+# any constant shared by every process migrating the same database
+ADVISORY_LOCK_ID = 20190614
+
+
+def _create_tables(connection):
+    # the tables as db.create_all() and trivia.psql first made them; kept
+    # frozen here so later model changes don't rewrite history
+    metadata = MetaData()
+    Table('categories', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('type', String))
+    Table('questions', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('question', String),
+          Column('answer', String),
+          Column('category', Integer, ForeignKey('categories.id')),
+          Column('difficulty', Integer))
+    metadata.create_all(connection, checkfirst=True)
+
+
+def _create_search_index(connection):
+    # PostgreSQL only; other databases search through flaskr.search.InvertedIndex
+    if connection.dialect.name == 'postgresql':
+        connection.execute(SEARCH_INDEX_DDL)
+
+
+def _create_question_indexes(connection):
+    # (category, id) serves category filters as well as their id ordering
+    # and keyset seeks, and covers the quiz index load; a separate index on
+    # category alone would only slow writes down
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_questions_category_id ON questions (category, id)"))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_questions_difficulty ON questions (difficulty)"))
+
+
+def _create_change_log(connection):
+    metadata = MetaData()
+    Table('question_changes', metadata,
+          Column('version', Integer, primary_key=True),
+          Column('action', String, nullable=False),
+          Column('question_id', Integer),
+          Column('question', String),
+          Column('answer', String),
+          Column('category', Integer),
+          Column('difficulty', Integer))
+    metadata.create_all(connection, checkfirst=True)
+
+
+def _create_jobs(connection):
+    metadata = MetaData()
+    Table('jobs', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('kind', String, nullable=False),
+          Column('status', String, nullable=False),
+          Column('params', Text),
+          Column('result', Text),
+          Column('error', Text),
+          Column('attempts', Integer, nullable=False),
+          Column('max_attempts', Integer, nullable=False),
+          Column('run_after', Float),
+          Column('created_at', DateTime),
+          Column('started_at', DateTime),
+          Column('finished_at', DateTime))
+    metadata.create_all(connection, checkfirst=True)
+
+
+def _add_change_times(connection):
+    # when each change was committed, for the Last-Modified of the listings;
+    # rows logged before this step keep NULL
+    columns = {column['name'] for column in inspect(connection).get_columns('question_changes')}
+    if 'changed_at' not in columns:
+        connection.execute(text('ALTER TABLE question_changes ADD COLUMN changed_at TIMESTAMP'))
+
+
+def _cover_question_index_load(connection):
+    # the quiz index load reads difficulty as well since the difficulty
+    # buckets; (category, id, difficulty) covers it again and still serves
+    # everything (category, id) did, which it replaces
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_questions_category_id_difficulty ON questions (category, id, difficulty)"))
+    connection.execute(text("DROP INDEX IF EXISTS ix_questions_category_id"))
+
+
+MIGRATIONS = (
+    (1, 'create categories and questions', _create_tables),
+    (2, 'full-text index on questions.question', _create_search_index),
+    (3, 'indexes on questions (category, id) and (difficulty)', _create_question_indexes),
+    (4, 'question change log', _create_change_log),
+    (5, 'background jobs', _create_jobs),
+    (6, 'question change log times', _add_change_times),
+    (7, 'index on questions (category, id, difficulty)', _cover_question_index_load),
+)
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def _version_table():
+    return Table(VERSION_TABLE, MetaData(), Column('version', Integer, nullable=False))
+
+
+def current_version(connection):
+    """The version a database is at; 0 if it was never migrated."""
+    if not connection.dialect.has_table(connection, VERSION_TABLE):
+        return 0
+    return connection.execute(text('SELECT max(version) FROM {}'.format(VERSION_TABLE))).scalar() or 0
+
+
+def upgrade(engine, target=None):
+    """
+    Apply the migrations above the database's version, up to `target`
+    (default: all). Returns the (version, description) pairs applied.
+    """
+    target = LATEST_VERSION if target is None else target
+    with engine.connect() as connection:
+        if current_version(connection) >= target:
+            return []
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version > target:
+            break
+        with engine.begin() as connection:
+            if connection.dialect.name == 'postgresql':
+                connection.execute(text('SELECT pg_advisory_xact_lock(:id)'), id=ADVISORY_LOCK_ID)
+            table = _version_table()
+            table.create(connection, checkfirst=True)
+            if current_version(connection) >= version:
+                continue
+            step(connection)
+            connection.execute(table.delete())
+            connection.execute(table.insert(), version=version)
+        applied.append((version, description))
+    return applied
+
+
+def register_commands(app):
+
+    @app.cli.command('db-upgrade')
+    @click.option('--target', type=int, help='stop at this version instead of the latest')
+    def db_upgrade(target):
+        """Apply pending schema migrations."""
+        applied = upgrade(db.get_engine(app), target)
+        for version, description in applied:
+            click.echo('applied {}: {}'.format(version, description))
+        if not applied:
+            click.echo('nothing to apply')
+
+    @app.cli.command('db-version')
+    def db_version():
+        """Print the schema version of the database and the latest one."""
+        with db.get_engine(app).connect() as connection:
+            click.echo('database at version {}, latest is {}'.format(current_version(connection), LATEST_VERSION))
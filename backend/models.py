@@ -1,35 +1,181 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, DateTime, Float, String, Integer, Text, create_engine, text, orm
+from flask import current_app, has_app_context
 from flask_sqlalchemy import SQLAlchemy
 import json
+from datetime import datetime
 from dotenv import dotenv_values
 
-config = dotenv_values(".env") 
+from replicas import ReplicaSet, RoutingSession
 
-database_name = config['DATABASE_NAME']
-database_user = config['DATABASE_USER']
-database_password = config['DATABASE_PASSWORD']
-database_path = 'postgresql://{}:{}@{}/{}'.format(database_user, database_password, 'localhost:5432', database_name)
 
-db = SQLAlchemy()
+class RoutingSQLAlchemy(SQLAlchemy):
+    # sessions that can send reads to a replica, see replicas.py
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+db = RoutingSQLAlchemy()
+
+# text search configuration of the question full-text index
+SEARCH_CONFIG = 'english'
+SEARCH_INDEX_DDL = text(
+    "CREATE INDEX IF NOT EXISTS ix_questions_question_fts ON questions "
+    "USING gin (to_tsvector('{}'::regconfig, question))".format(SEARCH_CONFIG))
+
+# serializes appends to the question change log on PostgreSQL, see
+# record_changes
+CHANGE_LOG_LOCK_ID = 20190615
+
+# connection pool settings read by setup_db, from app.config or the
+# environment; unset ones keep SQLAlchemy's defaults
+POOL_SETTINGS = {
+    'DATABASE_POOL_SIZE': ('pool_size', int),
+    'DATABASE_MAX_OVERFLOW': ('max_overflow', int),
+    'DATABASE_POOL_TIMEOUT': ('pool_timeout', int),
+    'DATABASE_POOL_RECYCLE': ('pool_recycle', int),
+    'DATABASE_POOL_PRE_PING': ('pool_pre_ping', lambda value: str(value).lower() in ('1', 'true', 'yes')),
+}
+POOL_DEFAULTS = {
+    'pool_recycle': 1800,
+    'pool_pre_ping': True,
+}
+
+"""
+default_database_path()
+    DATABASE_URL from the environment if set, otherwise the PostgreSQL
+    database described in .env; read when an app is set up, not at import
+"""
+def default_database_path():
+    if os.environ.get('DATABASE_URL'):
+        return os.environ['DATABASE_URL']
+    config = dotenv_values(".env")
+    return 'postgresql://{}:{}@{}/{}'.format(
+        config['DATABASE_USER'], config['DATABASE_PASSWORD'],
+        config.get('DATABASE_HOST', 'localhost:5432'), config['DATABASE_NAME'])
+
+def _setting(app, key, default=None):
+    if key in app.config:
+        return app.config[key]
+    return os.environ.get(key, default)
+
+def engine_options(app, database_path):
+    options = dict(app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))
+    if database_path.startswith('sqlite'):
+        # SQLite has no connection pool to size; Flask-SQLAlchemy already
+        # shares one connection across threads for in-memory databases
+        return options
+    for key, (option, cast) in POOL_SETTINGS.items():
+        value = _setting(app, key)
+        if value is not None:
+            options.setdefault(option, cast(value))
+    for option, value in POOL_DEFAULTS.items():
+        options.setdefault(option, value)
+    return options
+
+def replica_urls(app):
+    value = _setting(app, 'DATABASE_REPLICA_URLS')
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    return [path.strip() for path in value if path.strip()]
+
+def should_create_schema(app, database_path):
+    value = _setting(app, 'DATABASE_CREATE_ALL')
+    if value is not None:
+        return str(value).lower() in ('1', 'true', 'yes')
+    # an in-memory database starts empty in every process
+    return database_path in ('sqlite://', 'sqlite:///:memory:')
 
 """
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+
+    the database is, in order: the database_path argument, the app's
+    SQLALCHEMY_DATABASE_URI, then default_database_path(); a 'sqlite://'
+    URI runs the whole app in memory. No statement is sent at boot: pending
+    migrations (see migrations.py) are applied by `flask db-upgrade`, or at
+    startup only for in-memory SQLite or when DATABASE_CREATE_ALL is set
+
+    replicas of the primary, from the replica_paths argument or
+    DATABASE_REPLICA_URLS (a list, or comma separated in the environment),
+    become app.extensions['read_replicas']; see replicas.py
 """
-def setup_db(app, database_path=database_path):
+def setup_db(app, database_path=None, replica_paths=None):
+    database_path = database_path or app.config.get("SQLALCHEMY_DATABASE_URI") or default_database_path()
+    if replica_paths is None:
+        replica_paths = replica_urls(app)
+    replica_options = [engine_options(app, path) for path in replica_paths]
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app, database_path)
     db.app = app
     db.init_app(app)
-    db.create_all()
+    if replica_paths:
+        app.extensions['read_replicas'] = ReplicaSet(
+            [create_engine(path, **options) for path, options in zip(replica_paths, replica_options)],
+            check_interval=int(_setting(app, 'REPLICA_CHECK_INTERVAL', 30)),
+            sticky_seconds=int(_setting(app, 'REPLICA_STICKY_SECONDS', 5)))
+    if should_create_schema(app, database_path):
+        # imported here, migrations builds on this module
+        from migrations import upgrade
+        upgrade(db.get_engine(app))
+
+"""
+subscribe(app, listener)
+    registers listener(table, action, record) on an app; it is called after
+    a Question or Category write has been committed, with a plain dict
+    snapshot of the row so listeners never touch expired ORM state; bulk
+    writes that bypass the ORM send action 'reload' with no record
+"""
+def subscribe(app, listener):
+    app.extensions.setdefault('trivia_listeners', []).append(listener)
+
+def notify(table, action, record):
+    if not has_app_context():
+        return
+    for listener in current_app.extensions.get('trivia_listeners', []):
+        listener(table, action, record)
+
+"""
+record_changes(action, records)
+    appends one question change log row per record to the current
+    transaction, so the log commits or rolls back with the write itself;
+    a None record logs a 'reload' of the whole table. On PostgreSQL the
+    appending transactions are serialized until they commit, so versions
+    become visible in order and a reader never skips one still in flight
+"""
+def record_changes(action, records):
+    if not records:
+        return
+    changed_at = datetime.utcnow()
+    if db.session.bind.dialect.name == 'postgresql':
+        db.session.execute(text('SELECT pg_advisory_xact_lock(:id)'), {'id': CHANGE_LOG_LOCK_ID})
+    db.session.execute(QuestionChange.__table__.insert(), [{
+        'action': action,
+        'question_id': record['id'] if record else None,
+        'question': record['question'] if record else None,
+        'answer': record['answer'] if record else None,
+        'category': record['category'] if record else None,
+        'difficulty': record['difficulty'] if record else None,
+        'changed_at': changed_at,
+    } for record in records])
 
 """
 Question
 
+    insert(), update() and delete() commit immediately and return the
+    committed row as a dict (the same shape as format()); each also
+    appends to the question change log
 """
 class Question(db.Model):
     __tablename__ = 'questions'
+    # created by migrations.py, declared here so the metadata matches
+    __table_args__ = (
+        db.Index('ix_questions_category_id_difficulty', 'category', 'id', 'difficulty'),
+        db.Index('ix_questions_difficulty', 'difficulty'),
+    )
 
     id = Column(Integer, primary_key=True)
     question = Column(String)
@@ -45,14 +191,28 @@ class Question(db.Model):
 
     def insert(self):
         db.session.add(self)
+        db.session.flush()
+        record = self.format()
+        record_changes('insert', [record])
         db.session.commit()
+        notify(self.__tablename__, 'insert', record)
+        return record
 
     def update(self):
+        db.session.flush()
+        record = self.format()
+        record_changes('update', [record])
         db.session.commit()
+        notify(self.__tablename__, 'update', record)
+        return record
 
     def delete(self):
+        record = self.format()
         db.session.delete(self)
+        record_changes('delete', [record])
         db.session.commit()
+        notify(self.__tablename__, 'delete', record)
+        return record
 
     def format(self):
         return {
@@ -63,6 +223,78 @@ class Question(db.Model):
             'difficulty': self.difficulty
             }
 
+"""
+QuestionChange
+
+    one committed question write; versions only grow. Deletes keep the
+    row as it was, a 'reload' (bulk import) has no question and means
+    every copy of the table has to be fetched again
+"""
+class QuestionChange(db.Model):
+    __tablename__ = 'question_changes'
+
+    version = Column(Integer, primary_key=True)
+    action = Column(String, nullable=False)
+    question_id = Column(Integer)
+    question = Column(String)
+    answer = Column(String)
+    category = Column(Integer)
+    difficulty = Column(Integer)
+    changed_at = Column(DateTime)
+
+    def format(self):
+        return {
+            'version': self.version,
+            'action': self.action,
+            'id': self.question_id,
+            'question': {
+                'id': self.question_id,
+                'question': self.question,
+                'answer': self.answer,
+                'category': self.category,
+                'difficulty': self.difficulty
+                } if self.action in ('insert', 'update') else None
+            }
+
+"""
+Job
+
+    one background job of flaskr.jobs; params and result are JSON text.
+    Status moves queued -> running -> succeeded, or back to queued while
+    attempts are left, or to failed
+"""
+class Job(db.Model):
+    __tablename__ = 'jobs'
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    params = Column(Text)
+    result = Column(Text)
+    error = Column(Text)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False)
+    # seconds since the epoch, when a queued job may start
+    run_after = Column(Float)
+    created_at = Column(DateTime)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    def format(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'params': json.loads(self.params) if self.params else {},
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            }
+
 """
 Category
 
@@ -77,6 +309,28 @@ class Category(db.Model):
     def __init__(self, type):
         self.type = type
 
+    def insert(self):
+        db.session.add(self)
+        db.session.flush()
+        record = self.format()
+        db.session.commit()
+        notify(self.__tablename__, 'insert', record)
+        return record
+
+    def update(self):
+        db.session.flush()
+        record = self.format()
+        db.session.commit()
+        notify(self.__tablename__, 'update', record)
+        return record
+
+    def delete(self):
+        record = self.format()
+        db.session.delete(self)
+        db.session.commit()
+        notify(self.__tablename__, 'delete', record)
+        return record
+
     def format(self):
         return {
             'id': self.id,
@@ -0,0 +1,134 @@
+"""
+Read replicas
+
+With DATABASE_REPLICA_URLS set, setup_db gives the app a ReplicaSet and
+the db session routes the reads of read-only requests to a replica: GET
+requests and the quiz draws named by the app. Everything else, and any
+write or flush whatever the request, uses the primary.
+
+Replicas are taken round-robin, one per request. A replica whose
+connection fails is left out until a `SELECT 1` succeeds again, tried at
+most every `check_interval` seconds; with no replica up, reads go to the
+primary.
+
+Replicas lag behind the primary, so reads stay on the primary for
+`sticky_seconds` after a write: for the client that wrote, through a
+cookie set on the response of a request that committed a write (it
+follows the client across worker processes; a search through POST
+/questions sets none), and for every request of the process that committed it, so
+the in-process caches refilled after the write don't load stale rows.
+"""
+import threading
+import time
+
+from flask import g, has_app_context, request
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy import event, exc, text
+from sqlalchemy.sql.dml import UpdateBase
+
+STICKY_COOKIE = 'trivia_read_primary'
+READ_METHODS = ('GET', 'HEAD')
+
+
+class Replica:
+    __slots__ = ('engine', 'healthy', 'failed_at')
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.healthy = True
+        self.failed_at = 0.0
+
+
+class ReplicaSet:
+
+    def __init__(self, engines, check_interval=30, sticky_seconds=5, clock=time.monotonic):
+        self.replicas = [Replica(engine) for engine in engines]
+        self.check_interval = check_interval
+        self.sticky_seconds = sticky_seconds
+        self.clock = clock
+        self.read_endpoints = set()
+        self._lock = threading.Lock()
+        self._next = 0
+        self._written_at = None
+        for replica in self.replicas:
+            event.listen(replica.engine, 'handle_error', self._error_listener(replica))
+
+    def _error_listener(self, replica):
+        def on_error(context):
+            if context.is_disconnect or isinstance(context.sqlalchemy_exception, exc.OperationalError):
+                self.mark_down(replica)
+        return on_error
+
+    def mark_down(self, replica):
+        with self._lock:
+            if replica.healthy:
+                replica.healthy = False
+                replica.failed_at = self.clock()
+
+    def _probe(self, replica):
+        with self._lock:
+            if self.clock() - replica.failed_at < self.check_interval:
+                return False
+            # one probe per interval, however many requests ask
+            replica.failed_at = self.clock()
+        try:
+            with replica.engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+        except exc.DBAPIError:
+            return False
+        with self._lock:
+            replica.healthy = True
+        return True
+
+    def choose(self):
+        """The engine of the next healthy replica, or None to use the primary."""
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+        for i in range(len(self.replicas)):
+            replica = self.replicas[(start + i) % len(self.replicas)]
+            if replica.healthy or self._probe(replica):
+                return replica.engine
+        return None
+
+    def _recently_written(self):
+        with self._lock:
+            return self._written_at is not None and self.clock() - self._written_at < self.sticky_seconds
+
+    def is_read(self):
+        return request.method in READ_METHODS or request.endpoint in self.read_endpoints
+
+    def start(self):
+        """before_request hook: pick the replica this request reads from."""
+        if not self.is_read() or STICKY_COOKIE in request.cookies or self._recently_written():
+            return
+        g.read_replica = self.choose()
+
+    def finish(self, response):
+        """after_request hook: keep a client that just wrote on the primary."""
+        if g.pop('replica_wrote', False):
+            response.set_cookie(STICKY_COOKIE, '1', max_age=self.sticky_seconds, httponly=True)
+        return response
+
+    def on_write(self, table, action, record):
+        """Write listener, see models.subscribe."""
+        with self._lock:
+            self._written_at = self.clock()
+        # tells finish() that this request wrote
+        g.replica_wrote = True
+
+    def init_app(self, app, read_endpoints=()):
+        self.read_endpoints.update(read_endpoints)
+        app.before_request(self.start)
+        app.after_request(self.finish)
+
+
+class RoutingSession(SignallingSession):
+    """Sends the reads of a request that picked a replica to that replica."""
+
+    def get_bind(self, mapper=None, clause=None):
+        if has_app_context() and not self._flushing and not isinstance(clause, UpdateBase):
+            engine = g.get('read_replica')
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper, clause)
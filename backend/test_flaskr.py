@@ -1,27 +1,55 @@
+import gzip
 import os
+import subprocess
+import sys
+import tempfile
 import unittest
 import json
-from flask_sqlalchemy import SQLAlchemy
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.engine import Engine
 
-from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr import create_app, bulk, changes, query_plans, quiz, search, serialization, QUESTIONS_PER_PAGE
+from flaskr.asgi import AsgiAdapter
+from flaskr.metrics import QueryBudgetExceeded
+from flaskr.response_cache import MemoryBackend
+from flaskr.store import QuestionStore
+from benchmarks import suite
+import migrations
+from models import db, engine_options, Category, Job, Question
 from dotenv import dotenv_values
 
 
+# `import flaskr` in a fresh interpreter and create_app() afterwards, in
+# seconds; generous so a loaded CI machine stays under them
+IMPORT_TIME_BUDGET = 2.0
+BOOT_TIME_BUDGET = 0.5
+
+
 class TriviaTestCase(unittest.TestCase):
     """This class represents the trivia test case"""
 
+    @classmethod
+    def setUpClass(cls):
+        """Read the test database settings and migrate it, once per run."""
+        config = dotenv_values(".env")
+        cls.database_name = config['DATABASE_NAME_TEST']
+        cls.database_user = config['DATABASE_USER']
+        cls.database_password = config['DATABASE_PASSWORD']
+        cls.database_path = 'postgresql://{}:{}@{}/{}'.format(cls.database_user, cls.database_password, 'localhost:5432', cls.database_name)
+        create_app({'SQLALCHEMY_DATABASE_URI': cls.database_path, 'DATABASE_CREATE_ALL': True})
+
+    def new_app(self, **config):
+        """An app on the test database with query budgets enforced."""
+        return create_app(dict({'SQLALCHEMY_DATABASE_URI': self.database_path, 'QUERY_BUDGET_ENFORCE': True}, **config))
+
     def setUp(self):
         """Define test variables and initialize app."""
-        self.app = create_app()
+        self.app = self.new_app()
         self.client = self.app.test_client
-        
-        config = dotenv_values(".env") 
-        self.database_name = config['DATABASE_NAME_TEST']
-        self.database_user = config['DATABASE_USER']
-        self.database_password = config['DATABASE_PASSWORD']
-        self.database_path = 'postgresql://{}:{}@{}/{}'.format(self.database_user, self.database_password, 'localhost:5432', self.database_name)
-        setup_db(self.app, self.database_path)
 
         self.new_question = {
         'question':  'Heres a new question string',
@@ -29,13 +57,14 @@ class TriviaTestCase(unittest.TestCase):
         'difficulty': 1,
         'category': 3,
         }
-        # binds the app to the current context
+
+    def create_question(self, **fields):
+        """Insert a question for this test only; it is deleted again when the test ends."""
         with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
-    
+            record = Question(**dict(self.new_question, **fields)).insert()
+        self.addCleanup(self.client().delete, "/questions/{}".format(record["id"]))
+        return record["id"]
+
     def tearDown(self):
         """Executed after reach test"""
         # self.db.session.execute("ALTER SEQUENCE Question_id_seq RESTART WITH 24")
@@ -55,6 +84,29 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(data['categories']) # Test if there is a total number of books in the response
     
+    def test_304_sent_for_unchanged_categories(self):
+        res = self.client().get('/categories')
+        etag = res.headers.get('ETag')
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+
+        self.assertTrue(etag)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+    def test_category_cache_invalidated_on_write(self):
+        etag = self.client().get('/categories').headers.get('ETag')
+        with self.app.app_context():
+            category = Category(type='Music')
+            category.insert()
+            category_id = category.id
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+        data = json.loads(res.data)
+        with self.app.app_context():
+            Category.query.get(category_id).delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['categories'][str(category_id)], 'Music')
+
     def test_get_paginated_questions(self):
         res = self.client().get("/questions")
         data = json.loads(res.data)
@@ -66,6 +118,32 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(len(data["questions"]))
         self.assertTrue(len(data["categories"]))
 
+    def test_get_questions_with_cursor(self):
+        first = json.loads(self.client().get("/questions").data)
+        res = self.client().get("/questions?cursor={}".format(first["next_cursor"]))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(data["total_questions"], first["total_questions"])
+        self.assertTrue(len(data["questions"]))
+        self.assertGreater(data["questions"][0]["id"], first["questions"][-1]["id"])
+
+    def test_legacy_page_matches_cursor_page(self):
+        first = json.loads(self.client().get("/questions").data)
+        by_page = json.loads(self.client().get("/questions?page=2").data)
+        by_id = json.loads(self.client().get(
+            "/questions?after_id={}".format(first["questions"][-1]["id"])).data)
+
+        self.assertEqual(by_page["questions"], by_id["questions"])
+
+    def test_422_sent_with_invalid_cursor(self):
+        res = self.client().get("/questions?cursor=not-a-cursor")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data["success"], False)
+
     def test_404_sent_requesting_beyond_valid_page(self):
         res = self.client().get("/questions?page=1000", json={"rating": 1})
         data = json.loads(res.data)
@@ -84,6 +162,33 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data["currentCategory"])
         self.assertTrue(len(data["questions"]))
 
+    def test_get_questions_by_category_paginated(self):
+        for i in range(QUESTIONS_PER_PAGE):
+            self.create_question(category=1, question="Science {}".format(i))
+        first = json.loads(self.client().get("/categories/1/questions").data)
+        res = self.client().get("/categories/1/questions?cursor={}".format(first["next_cursor"]))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(first["questions"]), QUESTIONS_PER_PAGE)
+        self.assertEqual(first["totalQuestions"], len(first["questions"]) + len(data["questions"]))
+        self.assertIsNone(data["next_cursor"])
+        self.assertTrue(all(q["category"] == 1 for q in data["questions"]))
+
+    def test_get_questions_by_category_with_fields(self):
+        res = self.client().get("/categories/1/questions?fields=question")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(set(data["questions"][0]), {"id", "question"})
+
+    def test_422_get_questions_with_unknown_field(self):
+        res = self.client().get("/categories/1/questions?fields=password")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data["success"], False)
+
     def test_404_get_requesting_beyond_valid_category(self):
         res = self.client().get("/categories/1000/questions")
         data = json.loads(res.data)
@@ -98,7 +203,94 @@ class TriviaTestCase(unittest.TestCase):
 
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data["success"], True)
+        self.assertEqual(data["question"]["id"], data["created"])
+        self.assertEqual(data["question"]["question"], self.new_question["question"])
+        self.assertNotIn("questions", data)
+
+    def test_create_new_question_with_page_and_total(self):
+        total = json.loads(self.client().get("/questions").data)["total_questions"]
+        res = self.client().post("/questions?include=page,total", json=self.new_question)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
         self.assertTrue(data["questions"])
+        self.assertEqual(data["total_questions"], total + 1)
+
+    def test_422_if_new_question_is_invalid(self):
+        res = self.client().post("/questions", json=dict(self.new_question, difficulty=9))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data["success"], False)
+
+    def test_import_questions_ndjson(self):
+        lines = [
+            json.dumps(self.new_question),
+            json.dumps(dict(self.new_question, difficulty=9)),
+            'not json',
+        ]
+        res = self.client().post("/questions/import", data="\n".join(lines),
+                                 content_type="application/x-ndjson")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["imported"], 1)
+        self.assertEqual(data["rejected"], 2)
+        self.assertEqual([error["line"] for error in data["errors"]], [2, 3])
+
+    def test_import_questions_csv(self):
+        body = "question,answer,difficulty,category\nImported?,Yes,2,1\n"
+        total = json.loads(self.client().get("/questions").data)["total_questions"]
+        res = self.client().post("/questions/import", data=body, content_type="text/csv")
+        data = json.loads(res.data)
+        after = json.loads(self.client().get("/questions").data)["total_questions"]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["imported"], 1)
+        self.assertEqual(after, total + 1)
+
+    def test_partial_import_reloads_derived_state(self):
+        def rows():
+            yield 1, dict(self.new_question, question='Imported before the failure?')
+            raise RuntimeError('connection lost')
+
+        with self.app.app_context():
+            total = self.app.extensions['question_counter'].value()
+            since = changes.latest_version()
+            with self.assertRaises(RuntimeError):
+                bulk.import_questions(rows(), self.app.extensions['category_cache'].exists, batch_size=1)
+            counted = self.app.extensions['question_counter'].value()
+            logged = [change.action for change in changes.changes_since(since)[0]]
+            Question.query.filter(Question.question == 'Imported before the failure?').delete()
+            Question.query.session.commit()
+
+        self.assertEqual(counted, total + 1)
+        self.assertEqual(logged, ['reload'])
+
+    def test_export_questions(self):
+        res = self.client().get("/questions/export")
+        rows = [json.loads(line) for line in res.data.decode().splitlines()]
+        total = json.loads(self.client().get("/questions").data)["total_questions"]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, "application/x-ndjson")
+        self.assertEqual(len(rows), total)
+        self.assertEqual(set(rows[0]), {"id", "question", "answer", "difficulty", "category"})
+
+    def test_export_stays_streamed_when_compression_accepted(self):
+        res = self.client().get("/questions/export?format=csv", headers={"Accept-Encoding": "gzip"},
+                                buffered=False)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.is_streamed)
+        self.assertNotIn("Content-Length", res.headers)
+        self.assertNotIn("Content-Encoding", res.headers)
+        self.assertTrue(res.get_data().startswith(b"id,"))
+
+    def test_400_export_unknown_format(self):
+        res = self.client().get("/questions/export?format=xml")
+
+        self.assertEqual(res.status_code, 400)
 
     def test_405_if_question_creation_not_allowed(self):
         res = self.client().post("/questions/45", json=self.new_question)
@@ -109,18 +301,109 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["message"], "method not allowed")
 
     def test_delete_question(self):
-        res = self.client().delete("/questions/10")
+        question_id = self.create_question()
+        res = self.client().delete("/questions/{}?include=page,total".format(question_id))
         data = json.loads(res.data)
 
-        book = Question.query.filter(Question.id == 10).one_or_none()
+        book = Question.query.filter(Question.id == question_id).one_or_none()
 
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data["success"], True)
-        self.assertEqual(data["deleted"], 10)
+        self.assertEqual(data["deleted"], question_id)
         self.assertTrue(data["totalQuestions"])
         self.assertTrue(len(data["questions"]))
         self.assertEqual(book, None)
 
+    def test_delete_question_returns_only_deleted_id(self):
+        question_id = self.create_question()
+        res = self.client().delete("/questions/{}".format(question_id))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data, {"success": True, "deleted": question_id})
+
+    def test_create_questions_batch(self):
+        items = [self.new_question, dict(self.new_question, question="Second batch question")]
+        total = json.loads(self.client().get("/questions").data)["total_questions"]
+        res = self.client().post("/questions/batch", json={"questions": items})
+        data = json.loads(res.data)
+        after = json.loads(self.client().get("/questions").data)["total_questions"]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(len(data["created"]), 2)
+        self.assertEqual([result["status"] for result in data["results"]], ["created", "created"])
+        self.assertEqual(after, total + 2)
+
+    def test_422_create_questions_batch_with_invalid_item(self):
+        items = [self.new_question, dict(self.new_question, answer="")]
+        total = json.loads(self.client().get("/questions").data)["total_questions"]
+        res = self.client().post("/questions/batch", json={"questions": items})
+        data = json.loads(res.data)
+        after = json.loads(self.client().get("/questions").data)["total_questions"]
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["created"], [])
+        self.assertEqual(data["results"][1]["status"], "invalid")
+        self.assertEqual(after, total)
+
+    def test_delete_questions_batch(self):
+        ids = [self.create_question(), self.create_question()]
+        res = self.client().delete("/questions?ids={},{},-1".format(*ids))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["deleted"], ids)
+        self.assertEqual(data["results"][2], {"id": -1, "status": "not_found"})
+        self.assertEqual(self.client().delete("/questions/{}".format(ids[0])).status_code, 404)
+
+    def test_delete_questions_batch_from_body(self):
+        ids = [self.create_question(), self.create_question()]
+        res = self.client().delete("/questions", json={"ids": ids})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["deleted"], ids)
+
+    def test_question_changes_since_version(self):
+        with self.app.app_context():
+            version = changes.latest_version()
+        created = json.loads(self.client().post('/questions', json=self.new_question).data)['created']
+        self.client().delete('/questions/{}'.format(created))
+        res = self.client().get('/questions/changes?since={}'.format(version))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([(change['action'], change['id']) for change in data['changes']],
+                         [('insert', created), ('delete', created)])
+        self.assertEqual(data['changes'][0]['question']['answer'], self.new_question['answer'])
+        self.assertEqual(data['version'], data['changes'][-1]['version'])
+        self.assertFalse(data['reset'])
+
+    def test_question_changes_long_poll_wakes_on_write(self):
+        with self.app.app_context():
+            version = changes.latest_version()
+        writer = threading.Timer(0.2, lambda: self.client().post('/questions', json=self.new_question))
+        writer.start()
+        started = time.monotonic()
+        res = self.client().get('/questions/changes?since={}&wait=10'.format(version))
+        writer.join()
+        data = json.loads(res.data)
+
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(data['changes'][0]['action'], 'insert')
+
+    def test_question_changes_reset_after_prune(self):
+        with self.app.app_context():
+            version = changes.latest_version()
+            Question('Q1?', 'A', 1, 1).insert()
+            Question('Q2?', 'A', 1, 1).insert()
+            changes.prune(keep=1)
+        data = json.loads(self.client().get('/questions/changes?since={}'.format(version)).data)
+
+        self.assertTrue(data['reset'])
+
     def test_404_if_questions_does_not_exist(self):
         res = self.client().delete("/questions/-1")
         data = json.loads(res.data)
@@ -140,6 +423,277 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["success"], True)
         self.assertTrue(data["question"])
 
+    def test_request_question_from_all_categories(self):
+        res = self.client().post("/quizzes", json={
+            'previous_questions': [],
+            'quiz_category': {'id': 0, 'type': 'click'}
+            })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertTrue(data["question"])
+
+    def test_request_quiz_never_repeats_and_ends(self):
+        previous_questions = []
+        while True:
+            res = self.client().post("/quizzes", json={
+                'previous_questions': previous_questions,
+                'quiz_category': {'id': 1, 'type': 'Science'}
+                })
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            if data["question"] is None:
+                break
+            self.assertNotIn(data["question"]["id"], previous_questions)
+            self.assertEqual(data["question"]["category"], 1)
+            previous_questions.append(data["question"]["id"])
+
+        self.assertTrue(len(previous_questions))
+
+    def test_request_quiz_with_target_difficulty(self):
+        previous_questions = []
+        while True:
+            res = self.client().post("/quizzes", json={
+                'previous_questions': previous_questions,
+                'quiz_category': {'id': 0, 'type': 'click'},
+                'difficulty': 2,
+                })
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            if data["question"] is None:
+                break
+            self.assertEqual(data["question"]["difficulty"], 2)
+            previous_questions.append(data["question"]["id"])
+
+        with self.app.app_context():
+            self.assertEqual(len(previous_questions), Question.query.filter(Question.difficulty == 2).count())
+
+    def test_adaptive_quiz_ramps_up_on_correct_answers(self):
+        previous_questions = []
+        levels = []
+        difficulty = None
+        for _ in range(3):
+            res = self.client().post("/quizzes", json={
+                'previous_questions': previous_questions,
+                'quiz_category': {'id': 0, 'type': 'click'},
+                'adaptive': True,
+                'difficulty': difficulty,
+                'correct': True,
+                })
+            data = json.loads(res.data)
+            difficulty = data["difficulty"]
+            levels.append(difficulty)
+            previous_questions.append(data["question"]["id"])
+
+        self.assertEqual(levels, [1, 2, 3])
+
+    def test_422_request_quiz_with_invalid_difficulty(self):
+        res = self.client().post("/quizzes", json={'previous_questions': [], 'difficulty': 9})
+
+        self.assertEqual(res.status_code, 422)
+
+    def test_422_quiz_with_non_boolean_adaptive(self):
+        for adaptive in ("false", "0", 0, 1.0):
+            res = self.client().post("/quizzes", json={'previous_questions': [], 'adaptive': adaptive})
+            session = self.client().post("/quizzes/sessions", json={'adaptive': adaptive})
+
+            self.assertEqual((res.status_code, session.status_code), (422, 422), adaptive)
+
+    def test_difficulty_buckets_follow_writes(self):
+        with self.app.app_context():
+            index = quiz.QuestionIndex()
+            index.load([(1, 1, 2), (2, 1, 3), (3, 2, 3)])
+            index.on_write('questions', 'insert', {'id': 4, 'category': 1, 'difficulty': 3})
+            index.on_write('questions', 'delete', {'id': 2, 'category': 1, 'difficulty': 3})
+
+            self.assertEqual(index.ids(1, 3), [4])
+            self.assertEqual(index.size(quiz.ALL_CATEGORIES, 3), 2)
+            self.assertEqual(index.draw(1, {4}, 3), None)
+            self.assertEqual(index.draw_nearest(1, {4}, 3), 1)
+
+    def test_404_request_quiz_unknown_category(self):
+        res = self.client().post("/quizzes", json={
+            'previous_questions': [],
+            'quiz_category': {'id': 1000, 'type': 'Unknown'}
+            })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data["success"], False)
+
+    def test_play_quiz_session(self):
+        res = self.client().post("/quizzes/sessions", json={
+            'quiz_category': {'id': 1, 'type': 'Science'}
+            })
+        data = json.loads(res.data)
+        session_id = data["session"]["id"]
+        played = []
+        while True:
+            res = self.client().post("/quizzes/sessions/{}/next".format(session_id))
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            if data["question"] is None:
+                break
+            self.assertNotIn(data["question"]["id"], played)
+            played.append(data["question"]["id"])
+        res = self.client().delete("/quizzes/sessions/{}".format(session_id))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["finished"], session_id)
+        self.assertEqual(data["session"]["remaining"], 0)
+        self.assertTrue(len(played))
+
+    def test_play_adaptive_quiz_session(self):
+        res = self.client().post("/quizzes/sessions", json={'adaptive': True})
+        session_id = json.loads(res.data)["session"]["id"]
+        levels = []
+        for correct in (True, True, False):
+            res = self.client().post("/quizzes/sessions/{}/next".format(session_id), json={'correct': correct})
+            levels.append(json.loads(res.data)["session"]["difficulty"])
+
+        self.assertEqual(levels, [1, 2, 1])
+
+    def test_404_next_question_of_unknown_session(self):
+        res = self.client().post("/quizzes/sessions/unknown/next")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data["success"], False)
+
+    def test_idle_quiz_sessions_are_evicted(self):
+        now = [0.0]
+        with self.app.app_context():
+            index = quiz.QuestionIndex()
+            index.load([(1, 1, 2), (2, 1, 3)])
+            sessions = quiz.QuizSessionStore(index, idle_timeout=10, clock=lambda: now[0])
+            session = sessions.create(1)
+            now[0] = 11.0
+
+            self.assertIsNone(sessions.get(session.id))
+            self.assertEqual(len(sessions), 0)
+
+    def test_shared_decks_follow_writes(self):
+        with self.app.app_context():
+            index = quiz.QuestionIndex()
+            index.load([(1, 1, 2), (2, 1, 3), (3, 2, 3)])
+            decks = quiz.SharedDecks(index)
+            before = decks.get(1)
+            for record in ({'id': 4, 'category': 1, 'difficulty': 3}, {'id': 1, 'category': 2, 'difficulty': 2}):
+                index.on_write('questions', 'update', record)
+                decks.on_write('questions', 'update', record)
+
+            self.assertEqual(sorted(before), [1, 2])
+            self.assertEqual(sorted(decks.get(1)), [2, 4])
+            self.assertEqual(sorted(decks.get(2)), [1, 3])
+            self.assertEqual(sorted(decks.get(1, 3)), [2, 4])
+
+    def test_shared_decks_copy_once_per_batch_of_writes(self):
+        with self.app.app_context():
+            index = quiz.QuestionIndex()
+            index.load([(question_id, 1, 1) for question_id in range(1, 101)])
+            decks = quiz.SharedDecks(index)
+            before = decks.get(1)
+            snapshot = list(before)
+            for question_id in range(1, 51):
+                record = {'id': question_id}
+                index.on_write('questions', 'delete', record)
+                decks.on_write('questions', 'delete', record)
+            record = {'id': 101, 'category': 1, 'difficulty': 1}
+            index.on_write('questions', 'insert', record)
+            decks.on_write('questions', 'insert', record)
+            after = decks.get(1)
+
+            self.assertEqual(list(before), snapshot)
+            self.assertEqual(sorted(after), list(range(51, 102)))
+            self.assertEqual(decks._positions[1], {question_id: i for i, question_id in enumerate(after)})
+
+    def test_shared_deck_built_during_a_write_is_not_kept(self):
+        with self.app.app_context():
+            index = quiz.QuestionIndex()
+            index.load([(1, 1, 1), (2, 1, 1)])
+            decks = quiz.SharedDecks(index)
+            snapshot = index.ids
+
+            def ids_then_write(*args):
+                # the write lands after the deck's ids were read
+                ids = snapshot(*args)
+                if len(ids) == 2:
+                    record = {'id': 3, 'category': 1, 'difficulty': 1}
+                    index.on_write('questions', 'insert', record)
+                    decks.on_write('questions', 'insert', record)
+                return ids
+            index.ids = ids_then_write
+
+            self.assertEqual(sorted(decks.get(1)), [1, 2, 3])
+
+    def test_quiz_sessions_deal_from_one_shared_deck(self):
+        with self.app.app_context():
+            index = quiz.QuestionIndex()
+            index.load([(question_id, 1, 1) for question_id in range(1, 21)])
+            sessions = quiz.QuizSessionStore(index)
+            first, second = sessions.create(1), sessions.create(1)
+            dealt = [[sessions.deal(session.id) for _ in range(21)] for session in (first, second)]
+
+            self.assertIs(first.decks[None], second.decks[None])
+            for played in dealt:
+                self.assertEqual(played[-1], None)
+                self.assertEqual(sorted(played[:-1]), list(range(1, 21)))
+
+    def test_question_cache_serves_repeated_draws_from_memory(self):
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+        with self.app.app_context():
+            question = Question.query.order_by(Question.id).first()
+            cache = quiz.QuestionCache()
+            event.listen(Engine, 'before_cursor_execute', record)
+            try:
+                first = cache.get(question.id)
+                second = cache.get(question.id)
+            finally:
+                event.remove(Engine, 'before_cursor_execute', record)
+            cache.on_write('questions', 'update', dict(first, answer='changed'))
+
+            self.assertEqual(first, question.format())
+            self.assertIs(first, second)
+            self.assertEqual(len(statements), 1)
+            self.assertEqual(cache.get(question.id)['answer'], 'changed')
+
+    def test_question_store_serves_the_same_pages(self):
+        sql = self.new_app(RESPONSE_CACHE_ENABLED=False).test_client()
+        stored = self.new_app(RESPONSE_CACHE_ENABLED=False, QUESTION_STORE_ENABLED=True).test_client()
+        cursor = sql.get('/questions').get_json()['next_cursor']
+        paths = ['/questions', '/questions?page=2', '/questions?cursor={}'.format(cursor),
+                 '/questions?fields=answer', '/categories/1/questions', '/categories/1/questions?after_id=1',
+                 '/questions?page=1000']
+
+        for path in paths:
+            expected, actual = sql.get(path), stored.get(path)
+            self.assertEqual(actual.status_code, expected.status_code, path)
+            self.assertEqual(actual.get_json(), expected.get_json(), path)
+        # only the change log version behind the listing's validators
+        self.assertIn('desc="1 queries', stored.get('/questions?page=2').headers['Server-Timing'])
+
+    def test_question_store_follows_writes(self):
+        store = QuestionStore()
+        store.load([(1, 'q1', 'a1', 1, 1), (2, 'q2', 'a2', 1, 2), (3, 'q3', 'a3', 2, 3)])
+        store.on_write('questions', 'insert', {'id': 4, 'question': 'q4', 'answer': 'a4', 'category': 1,
+                                               'difficulty': 1})
+        store.on_write('questions', 'update', {'id': 1, 'question': 'q1', 'answer': 'a1', 'category': 2,
+                                               'difficulty': 1})
+        store.on_write('questions', 'delete', {'id': 2})
+        rows, next_cursor = store.page_from_request({}, ('id',), per_page=2)
+
+        self.assertEqual(rows, [(1,), (3,)])
+        self.assertEqual(store.page_from_request({'cursor': next_cursor}, ('id',), per_page=2), ([(4,)], None))
+        self.assertEqual(store.page_from_request({}, ('id', 'question'), 10, category_id=2)[0],
+                         [(1, 'q1'), (3, 'q3')])
+        self.assertEqual((store.count(), store.count(1)), (3, 1))
+        self.assertIsNone(store.get(2))
+
     def test_get_question_search_with_results(self):
         res = self.client().post("/questions", json={"searchTerm": "World"})
         data = json.loads(res.data)
@@ -149,6 +703,28 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data["totalQuestions"])
         self.assertTrue(len(data["questions"]))
 
+    def test_get_question_search_by_prefix(self):
+        ids = {self.create_question(question=question)
+               for question in ("Which quokkaball world cup went to overtime?", "The worst quokkaball season?")}
+        self.create_question(question="Who invented quokkaball?")
+        res = self.client().post("/questions", json={"searchTerm": "quokkaball wor"})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["totalQuestions"], 2)
+        self.assertEqual(set(q["id"] for q in data["questions"]), ids)
+
+    def test_get_question_search_total_counts_all_pages(self):
+        self.client().post("/questions", json={"searchTerm": "paging"})
+        for i in range(QUESTIONS_PER_PAGE + 1):
+            self.create_question(question="Paging question {}".format(i))
+        first = json.loads(self.client().post("/questions", json={"searchTerm": "paging"}).data)
+        second = json.loads(self.client().post("/questions", json={"searchTerm": "paging", "page": 2}).data)
+
+        self.assertEqual(first["totalQuestions"], QUESTIONS_PER_PAGE + 1)
+        self.assertEqual(len(first["questions"]), QUESTIONS_PER_PAGE)
+        self.assertEqual(len(second["questions"]), 1)
+
     def test_get_question_search_without_results(self):
         res = self.client().post(
             "/questions", json={"searchTerm": "sgfgfgfgfgfg"})
@@ -159,6 +735,398 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["totalQuestions"], 0)
         self.assertEqual(len(data["questions"]), 0)
 
+    def test_concurrent_identical_searches_share_one_query(self):
+        release = threading.Event()
+        calls = []
+
+        class SlowBackend:
+            def search(self, term, page, per_page):
+                calls.append(term)
+                release.wait(5)
+                return [(1, "q", "a", 1, 1)], 1
+
+            def on_write(self, table, action, record):
+                pass
+
+        coalescing = search.CoalescingSearch(SlowBackend(), ttl=60)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(coalescing.search("World riv", 1, 10)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while coalescing.stats["coalesced"] < 4:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [([(1, "q", "a", 1, 1)], 1)] * 5)
+        self.assertEqual(coalescing.search("world  RIV", 1, 10), results[0])
+        self.assertEqual(coalescing.stats, {"executed": 1, "coalesced": 4, "cache_hits": 1})
+        coalescing.on_write("questions", "insert", {"id": 2, "question": "q"})
+        coalescing.search("world riv", 1, 10)
+        self.assertEqual(len(calls), 2)
+
+    def test_search_result_cache_dropped_on_write(self):
+        first = self.client().post("/questions", json={"searchTerm": "zanzibar"}).get_json()
+        res = self.client().post("/questions", json={
+            "question": "Where is Zanzibar?", "answer": "Tanzania", "category": 3, "difficulty": 2})
+        self.assertEqual(res.status_code, 200)
+        second = self.client().post("/questions", json={"searchTerm": "zanzibar"}).get_json()
+
+        self.assertEqual(second["totalQuestions"], first["totalQuestions"] + 1)
+        self.client().delete("/questions/{}".format(res.get_json()["created"]))
+
+    def test_search_rate_limited_after_burst(self):
+        app = self.new_app(SEARCH_RATE_LIMIT=0.01, SEARCH_RATE_BURST=2)
+        client = app.test_client()
+        statuses = [client.post("/questions", json={"searchTerm": "title"}).status_code for _ in range(3)]
+        res = client.post("/questions", json={"searchTerm": "title"})
+        data = json.loads(res.data)
+        stats = client.get("/search/stats").get_json()
+
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(data["message"], "too many requests")
+        self.assertEqual(res.headers["Retry-After"], "100")
+        self.assertEqual((stats["allowed"], stats["limited"]), (2, 2))
+        self.assertEqual((stats["executed"], stats["cache_hits"]), (1, 1))
+
+    def test_projected_rows_match_format(self):
+        with self.app.app_context():
+            question = Question.query.order_by(Question.id).first()
+            row = serialization.question_query().filter(Question.id == question.id).one()
+
+            self.assertEqual(serialization.format_rows([row]), [question.format()])
+
+    def test_fast_json_encoder_matches_standard_encoder(self):
+        data = {"categories": {1: "Science", 2: "Art"}, "questions": [{"id": 1, "question": "Où?"}]}
+        fast = json.loads(json.dumps(data, cls=serialization.FastJSONEncoder))
+
+        self.assertEqual(fast, json.loads(json.dumps(data)))
+
+    def test_read_responses_are_cached_until_write(self):
+        first = self.client().get("/questions")
+        second = self.client().get("/questions")
+        self.client().post("/questions", json=self.new_question)
+        third = self.client().get("/questions")
+        stats = json.loads(self.client().get("/cache/stats").data)
+
+        self.assertEqual(first.headers["X-Cache"], "MISS")
+        self.assertEqual(second.headers["X-Cache"], "HIT")
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(third.headers["X-Cache"], "MISS")
+        self.assertEqual(json.loads(third.data)["total_questions"],
+                         json.loads(first.data)["total_questions"] + 1)
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+
+    def test_shared_cache_backend_invalidated_by_other_app(self):
+        backend = MemoryBackend()
+        reader = self.new_app(RESPONSE_CACHE_BACKEND=backend)
+        writer = self.new_app(RESPONSE_CACHE_BACKEND=backend)
+        question_id = self.create_question()
+        reader.test_client().get("/categories")
+        hit = reader.test_client().get("/categories")
+        deleted = writer.test_client().delete("/questions/{}".format(question_id))
+        miss = reader.test_client().get("/categories")
+
+        self.assertEqual(hit.headers["X-Cache"], "HIT")
+        self.assertEqual(deleted.status_code, 200)
+        self.assertEqual(miss.headers["X-Cache"], "MISS")
+
+    def test_listing_compressed_when_accepted(self):
+        client = self.new_app(COMPRESSION_MIN_SIZE=100).test_client()
+        plain = client.get("/questions")
+        compressed = client.get("/questions", headers={"Accept-Encoding": "gzip"})
+        replayed = client.get("/questions", headers={"Accept-Encoding": "gzip"})
+
+        self.assertNotIn("Content-Encoding", plain.headers)
+        self.assertEqual(compressed.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", compressed.headers["Vary"])
+        self.assertEqual(gzip.decompress(compressed.data), plain.data)
+        self.assertEqual(compressed.headers["ETag"], plain.headers["ETag"][:-1] + '-gzip"')
+        self.assertEqual(replayed.headers["X-Cache"], "HIT")
+        self.assertEqual(replayed.headers["Content-Encoding"], "gzip")
+        self.assertEqual(replayed.headers["ETag"], compressed.headers["ETag"])
+
+    def test_unchanged_listing_answered_304(self):
+        created = self.client().post("/questions", json=dict(self.new_question, category=1)).get_json()["created"]
+        first = self.client().get("/categories/1/questions")
+        etag, last_modified = first.headers["ETag"], first.headers["Last-Modified"]
+        by_etag = self.client().get("/categories/1/questions", headers={"If-None-Match": etag})
+        by_date = self.client().get("/categories/1/questions", headers={"If-Modified-Since": last_modified})
+        self.client().delete("/questions/{}".format(created))
+        changed = self.client().get("/categories/1/questions", headers={"If-None-Match": etag})
+
+        self.assertEqual(first.headers["Cache-Control"], "no-cache")
+        self.assertEqual((by_etag.status_code, by_etag.data), (304, b""))
+        self.assertEqual(by_date.status_code, 304)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers["ETag"], etag)
+
+    def test_listing_validators_follow_writes_of_other_workers(self):
+        reader = self.new_app(RESPONSE_CACHE_ENABLED=False).test_client()
+        writer = self.new_app().test_client()
+        first = reader.get("/questions")
+        same = writer.get("/questions", headers={"If-None-Match": first.headers["ETag"]})
+        created = writer.post("/questions", json=self.new_question).get_json()["created"]
+        changed = reader.get("/questions", headers={"If-None-Match": first.headers["ETag"]})
+        writer.delete("/questions/{}".format(created))
+
+        self.assertEqual(same.status_code, 304)
+        self.assertEqual(changed.status_code, 200)
+
+    def test_maintenance_job_runs_in_background(self):
+        res = self.client().post('/jobs', json={'kind': 'rebuild_indexes'})
+        job = res.get_json()['job']
+        self.app.extensions['jobs'].wait(job['id'], timeout=10)
+        data = self.client().get('/jobs/{}'.format(job['id'])).get_json()
+
+        self.assertEqual(res.status_code, 202)
+        self.assertEqual(job['status'], 'queued')
+        self.assertEqual(data['job']['status'], 'succeeded')
+        self.assertEqual(data['job']['attempts'], 1)
+        self.assertEqual(data['job']['result']['questions'],
+                         self.client().get('/questions').get_json()['total_questions'])
+
+    def test_failed_job_is_retried(self):
+        app = self.new_app(JOB_RETRY_DELAY=0.01, JOB_MAX_ATTEMPTS=2)
+        queue = app.extensions['jobs']
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) == 1:
+                raise RuntimeError('first attempt fails')
+            return 'done'
+
+        def broken():
+            raise RuntimeError('always fails')
+        queue.register('flaky', flaky)
+        queue.register('broken', broken)
+        with app.app_context():
+            ids = [queue.submit(kind)['id'] for kind in ('flaky', 'broken')]
+        flaky_job, broken_job = [queue.wait(job_id, timeout=10) for job_id in ids]
+
+        self.assertEqual((flaky_job['status'], flaky_job['attempts'], flaky_job['result']), ('succeeded', 2, 'done'))
+        self.assertEqual((broken_job['status'], broken_job['attempts']), ('failed', 2))
+        self.assertEqual(broken_job['error'], 'RuntimeError: always fails')
+        self.assertEqual(queue._timers, {})
+
+    def test_async_import_runs_as_job(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        app = self.new_app(JOB_FILES_DIR=directory.name)
+        body = "\n".join(json.dumps(dict(self.new_question, question='Imported in the background {}?'.format(i)))
+                         for i in range(2))
+        res = app.test_client().post('/questions/import?async=true', data=body,
+                                     content_type='application/x-ndjson')
+        job = app.extensions['jobs'].wait(res.get_json()['job']['id'], timeout=10)
+        with app.app_context():
+            imported = Question.query.filter(Question.question.like('Imported in the background%')).all()
+            ids = [question.id for question in imported]
+        for question_id in ids:
+            app.test_client().delete('/questions/{}'.format(question_id))
+
+        self.assertEqual(res.status_code, 202)
+        self.assertEqual(job['status'], 'succeeded')
+        # committed batches would be inserted again by a retry
+        self.assertEqual(job['max_attempts'], 1)
+        self.assertEqual(job['result']['imported'], 2)
+        self.assertEqual(len(ids), 2)
+        self.assertEqual(os.listdir(directory.name), [])
+
+    def test_jobs_past_their_lease_are_requeued(self):
+        app = self.new_app(JOB_LEASE_SECONDS=60)
+        queue = app.extensions['jobs']
+        started = datetime.utcnow() - timedelta(hours=1)
+        with app.app_context():
+            jobs = [Job(kind=kind, status='running', params='{}', attempts=1, max_attempts=max_attempts,
+                        run_after=0, started_at=started)
+                    for kind, max_attempts in (('warm_caches', 3), ('import_questions', 1))]
+            db.session.add_all(jobs)
+            db.session.commit()
+            abandoned, exhausted = [job.id for job in jobs]
+        res = app.test_client().post('/jobs', json={'kind': 'warm_caches'})
+        queue.wait(res.get_json()['job']['id'], timeout=10)
+        requeued = queue.wait(abandoned, timeout=10)
+        with app.app_context():
+            failed = queue.get(exhausted)
+
+        self.assertEqual(res.status_code, 202)
+        self.assertEqual((requeued['status'], requeued['attempts']), ('succeeded', 2))
+        self.assertEqual((failed['status'], failed['error']), ('failed', 'interrupted'))
+
+    def test_unknown_jobs(self):
+        self.assertEqual(self.client().get('/jobs/100000').status_code, 404)
+        self.assertEqual(self.client().post('/jobs', json={'kind': 'import_questions'}).status_code, 422)
+
+    def asgi_request(self, method, path, body=b"", query_string=b""):
+        adapter = AsgiAdapter(self.app, threads=2)
+        scope = {"type": "http", "method": method, "path": path, "query_string": query_string,
+                 "headers": [(b"content-type", b"application/json")]}
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(adapter(scope, receive, send))
+        adapter.executor.shutdown()
+        return sent[0]["status"], b"".join(message.get("body", b"") for message in sent[1:])
+
+    def test_asgi_adapter_serves_same_json(self):
+        status, body = self.asgi_request("GET", "/questions", query_string=b"page=2")
+        expected = self.client().get("/questions?page=2")
+
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)["questions"], json.loads(expected.data)["questions"])
+
+    def test_asgi_adapter_posts_body(self):
+        status, body = self.asgi_request("POST", "/quizzes", body=json.dumps({
+            'previous_questions': [], 'quiz_category': {'id': 1, 'type': 'Science'}}).encode())
+
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)["question"]["category"], 1)
+
+    def test_server_timing_and_metrics(self):
+        res = self.client().get('/questions?page=2')
+        self.assertIn('queries', res.headers['Server-Timing'])
+
+        metrics = self.client().get('/metrics').get_data(as_text=True)
+        self.assertIn('trivia_http_requests_total{endpoint="retrieve_questions",method="GET",status="200"} 1', metrics)
+        self.assertIn('trivia_db_queries_total{endpoint="retrieve_questions",method="GET"}', metrics)
+
+    def test_query_budget_exceeded(self):
+        app = self.new_app(TESTING=True, QUERY_BUDGETS={'retrieve_questions': 0})
+
+        with self.assertRaises(QueryBudgetExceeded):
+            app.test_client().get('/questions')
+
+    def test_import_time_budget(self):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import flaskr'],
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                stderr=subprocess.PIPE, universal_newlines=True, check=True)
+        # "import time: self [us] | cumulative | imported package"
+        imports = {}
+        for line in result.stderr.splitlines()[1:]:
+            _, cumulative, name = line.split('|')
+            imports[name.strip()] = int(cumulative) / 1e6
+
+        self.assertLess(imports['flaskr'], IMPORT_TIME_BUDGET)
+        for unused in ('sunau', 'multiprocessing'):
+            self.assertNotIn(unused, imports)
+
+    def test_boot_time_budget_without_database_round_trips(self):
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(Engine, 'before_cursor_execute', record)
+        try:
+            started = time.perf_counter()
+            self.new_app()
+            elapsed = time.perf_counter() - started
+        finally:
+            event.remove(Engine, 'before_cursor_execute', record)
+
+        self.assertLess(elapsed, BOOT_TIME_BUDGET)
+        self.assertEqual(statements, [])
+
+    def test_setup_db_pool_options_from_config(self):
+        self.app.config.update(DATABASE_POOL_SIZE=20, DATABASE_POOL_PRE_PING=False)
+        options = engine_options(self.app, 'postgresql://user@localhost/trivia')
+
+        self.assertEqual(options['pool_size'], 20)
+        self.assertEqual(options['pool_pre_ping'], False)
+        self.assertTrue(options['pool_recycle'])
+        self.assertEqual(engine_options(self.app, 'sqlite://'), {})
+
+    def replica(self):
+        """A migrated SQLite file with one question, standing in for a replica."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = 'sqlite:///' + os.path.join(directory.name, 'replica.db')
+        engine = create_engine(path)
+        migrations.upgrade(engine)
+        engine.execute(Category.__table__.insert(), id=1, type='Science')
+        engine.execute(Question.__table__.insert(), id=1, question='Only on the replica?', answer='yes',
+                       category=1, difficulty=1)
+        engine.dispose()
+        return path
+
+    def test_reads_go_to_replica_until_a_write(self):
+        app = self.new_app(DATABASE_REPLICA_URLS=[self.replica()], RESPONSE_CACHE_ENABLED=False)
+        client = app.test_client()
+        before = client.get('/questions').get_json()
+        searched = client.post('/questions', json={'searchTerm': 'replica'})
+        # the category cache was just filled from the replica, which has category 1 only
+        res = client.post('/questions', json=dict(self.new_question, category=1))
+        after = client.get('/questions').get_json()
+        client.delete('/questions/{}'.format(res.get_json()['created']))
+
+        self.assertEqual([q['question'] for q in before['questions']], ['Only on the replica?'])
+        self.assertNotIn('Set-Cookie', searched.headers)
+        self.assertIn('trivia_read_primary=1', res.headers['Set-Cookie'])
+        self.assertNotIn('Only on the replica?', [q['question'] for q in after['questions']])
+
+    def test_failed_replica_is_skipped(self):
+        app = self.new_app(DATABASE_REPLICA_URLS=[self.replica(), 'sqlite:////nonexistent/replica.db'],
+                           RESPONSE_CACHE_ENABLED=False)
+        client = app.test_client()
+        statuses = [client.get('/categories/1/questions').status_code for _ in range(4)]
+        replicas = app.extensions['read_replicas'].replicas
+
+        # the dead replica fails the one request routed to it before it is left out
+        self.assertEqual(statuses, [200, 422, 200, 200])
+        self.assertEqual([replica.healthy for replica in replicas], [True, False])
+
+    def test_migrations_reach_latest_version(self):
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+        with app.app_context():
+            engine = migrations.db.get_engine(app)
+            with engine.connect() as connection:
+                self.assertEqual(migrations.current_version(connection), migrations.LATEST_VERSION)
+            indexes = {index['name'] for index in inspect(engine).get_indexes('questions')}
+            self.assertEqual(migrations.upgrade(engine), [])
+        self.app = self.new_app()
+
+        self.assertIn('ix_questions_category_id_difficulty', indexes)
+        self.assertNotIn('ix_questions_category_id', indexes)
+        self.assertIn('ix_questions_difficulty', indexes)
+
+    def test_route_queries_use_indexes(self):
+        with self.app.app_context():
+            results = query_plans.check()
+
+        self.assertEqual(len(results), len(query_plans.ROUTE_QUERIES))
+        for route, statement, plan, problems in results:
+            self.assertEqual(problems, [], '{} {}: {}'.format(route, statement, plan))
+
+    def test_app_runs_on_in_memory_sqlite(self):
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+        with app.app_context():
+            Category(type='Science').insert()
+        res = app.test_client().get('/categories')
+        data = json.loads(res.data)
+        self.app = self.new_app()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['categories'], {'1': 'Science'})
+
+    def test_benchmark_suite_covers_every_route(self):
+        results = suite.benchmark('sqlite://', questions=200, categories=3, iterations=3, drivers=('client',))
+        routes = results['drivers']['client']
+
+        self.assertEqual(len(routes), len(suite.SCENARIOS))
+        self.assertTrue(all(row['failures'] == 0 for row in routes.values()))
+        self.assertEqual(suite.compare(results, results, tolerance=0), [])
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":